@@ -0,0 +1,150 @@
+import os
+from typing import Dict, List
+import numpy as np
+from sklearn.decomposition import TruncatedSVD
+
+from .knowledge_base import KBEngine
+
+KB_ANN_DIM = int(os.getenv("KB_ANN_DIM", "128"))
+# IVF lists (0 = about sqrt(articles)) and lists scanned per query;
+# raising KB_ANN_NPROBE trades latency for recall, 0 scans every list
+KB_ANN_NLIST = int(os.getenv("KB_ANN_NLIST", "0"))
+KB_ANN_NPROBE = int(os.getenv("KB_ANN_NPROBE", "8"))
+# Below this many articles the exact TF-IDF scoring is used instead
+KB_ANN_MIN_DOCS = int(os.getenv("KB_ANN_MIN_DOCS", "2000"))
+
+def _unit(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+class IVFIndex:
+    # Inverted-file index over unit vectors: spherical k-means centroids, each
+    # owning a contiguous slice of `order` (row numbers grouped by list)
+    def __init__(self, centroids: np.ndarray, order: np.ndarray, offsets: np.ndarray):
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+
+    @classmethod
+    def fit(cls, X: np.ndarray, nlist: int = 0, iters: int = 10, seed: int = 0) -> "IVFIndex":
+        n = len(X)
+        nlist = max(1, min(nlist or int(np.sqrt(n)), n))
+        rng = np.random.default_rng(seed)
+        sample = X[rng.choice(n, min(n, nlist * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iters):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]
+            centroids = _unit(sums)
+        return cls.assign(centroids, X)
+
+    @classmethod
+    def assign(cls, centroids: np.ndarray, X: np.ndarray) -> "IVFIndex":
+        assign = np.zeros(len(X), dtype=np.int64)
+        for start in range(0, len(X), 8192):
+            assign[start:start + 8192] = np.argmax(X[start:start + 8192] @ centroids.T, axis=1)
+        offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assign, minlength=len(centroids)), out=offsets[1:])
+        return cls(centroids, np.argsort(assign, kind="stable"), offsets)
+
+    def search(self, X: np.ndarray, qv: np.ndarray, nprobe: int):
+        nlist = len(self.centroids)
+        nprobe = nlist if nprobe <= 0 else min(nprobe, nlist)
+        lists = np.argpartition(-(self.centroids @ qv), nprobe - 1)[:nprobe]
+        rows = np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in lists])
+        return rows, X[rows] @ qv
+
+class SemanticKBEngine(KBEngine):
+    # Same interface and incremental maintenance as KBEngine, but scores in a
+    # dense LSA space (TruncatedSVD of the TF-IDF rows) searched through an
+    # IVF index. The SVD projection and centroids are fitted on a full build;
+    # compaction only re-embeds rows and reassigns them to existing lists.
+    name = "lsa-ivf"
+
+    def __init__(self, dim: int = KB_ANN_DIM, nlist: int = KB_ANN_NLIST, nprobe: int = KB_ANN_NPROBE,
+                 min_docs: int = KB_ANN_MIN_DOCS, **kwargs):
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_docs = min_docs
+        super().__init__(**kwargs)
+
+    def _reset(self):
+        super()._reset()
+        self._ann = None  # (active columns, SVD components, row embeddings, IVFIndex)
+
+    def _set_compacted(self, tf, ids, titles):
+        super()._set_compacted(tf, ids, titles)
+        self._ann = self._fit(self._ann)
+
+    def _embed(self, m, active: np.ndarray, components: np.ndarray) -> np.ndarray:
+        return _unit(np.asarray(m[:, active] @ components.T, dtype=np.float32))
+
+    def _fit(self, previous):
+        n = self.matrix.shape[0]
+        if n < max(self.min_docs, 2):
+            return None
+        if previous is None:
+            active = np.flatnonzero(self.df > 0)
+            k = min(self.dim, n - 1, len(active) - 1)
+            if k < 1:
+                return None
+            svd = TruncatedSVD(n_components=k, algorithm="randomized", random_state=0)
+            svd.fit(self.matrix[:, active])
+            components = svd.components_.astype(np.float32)
+            emb = self._embed(self.matrix, active, components)
+            return active, components, emb, IVFIndex.fit(emb, self.nlist)
+        active, components, _, ivf = previous
+        emb = self._embed(self.matrix, active, components)
+        return active, components, emb, IVFIndex.assign(ivf.centroids, emb)
+
+    def _extra_arrays(self) -> Dict[str, np.ndarray]:
+        if self._ann is None:
+            return {}
+        active, components, emb, ivf = self._ann
+        return {
+            "ann_active": active, "ann_components": components, "ann_embeddings": emb,
+            "ann_centroids": ivf.centroids, "ann_order": ivf.order, "ann_offsets": ivf.offsets,
+        }
+
+    def _restore_extra(self, arrays: Dict[str, np.ndarray]):
+        if "ann_embeddings" in arrays and len(arrays["ann_embeddings"]) == self.matrix.shape[0]:
+            ivf = IVFIndex(arrays["ann_centroids"], arrays["ann_order"], arrays["ann_offsets"])
+            self._ann = (arrays["ann_active"], arrays["ann_components"], arrays["ann_embeddings"], ivf)
+        else:
+            self._ann = self._fit(None)
+
+    def _score(self, blocks, q, dead, min_score: float):
+        ann = self._ann
+        if ann is None or len(ann[2]) != blocks[0].shape[0]:
+            yield from super()._score(blocks, q, dead, min_score)
+            return
+        active, components, emb, ivf = ann
+        n = len(emb)
+        qe = self._embed(q, active, components)
+        # Rows added since the last compaction are few; scan them directly
+        tail = self._embed(blocks[1], active, components) if len(blocks) > 1 else None
+        dead_rows = np.array(dead, dtype=np.int64)
+        for qv in qe:
+            rows, scores = ivf.search(emb, qv, self.nprobe)
+            if tail is not None:
+                rows = np.concatenate([rows, np.arange(n, n + len(tail))])
+                scores = np.concatenate([scores, tail @ qv])
+            keep = scores > min_score
+            if len(dead_rows):
+                keep &= ~np.isin(rows, dead_rows)
+            yield rows[keep].astype(np.int64), scores[keep].astype(np.float64)
+
+def recall_at_k(want: List[List[Dict]], got: List[List[Dict]]) -> float:
+    # Share of the reference results' ids (e.g. from the exact KBEngine) that
+    # the candidate results also contain, over suggest_many outputs
+    hits = total = 0
+    for w, g in zip(want, got):
+        ids = {s["id"] for s in w}
+        hits += len(ids & {s["id"] for s in g})
+        total += len(ids)
+    return hits / total if total else 1.0
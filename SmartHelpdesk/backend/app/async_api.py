@@ -0,0 +1,174 @@
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, or_, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import SessionLocal, Ticket, get_async_db
+from .routing import route_ticket
+from . import metrics
+from .metrics import span
+from . import main as api
+
+# Async versions of the ticket ingest/list/get/patch endpoints, used when
+# DATABASE_URL names an async driver. They share the request models and
+# helpers in main.py; only the database I/O differs.
+router = APIRouter()
+
+async def find_existing(db: AsyncSession, source: str, source_ref: Optional[str], key: Optional[str]) -> Optional[Ticket]:
+    if key:
+        t = (await db.execute(select(Ticket).where(Ticket.idempotency_key == key))).scalars().first()
+        if t:
+            return t
+    if source_ref:
+        stmt = select(Ticket).where(Ticket.source == source, Ticket.source_ref == source_ref)
+        return (await db.execute(stmt)).scalars().first()
+    return None
+
+async def run_write(db: AsyncSession, fn):
+    # Same contract as main.run_write: the SQLite writer thread when enabled,
+    # otherwise fn runs against this request's AsyncSession
+    with span("db_commit"):
+        if api.write_queue:
+            return await asyncio.wrap_future(api.write_queue.submit(fn))
+        result = await db.run_sync(fn)
+        await db.commit()
+        return result
+
+def prior_with_session(category: str, route: dict, confidence: Optional[float]) -> dict:
+    db = SessionLocal()
+    try:
+        return api.apply_historical_prior(db, category, route, confidence)
+    finally:
+        db.close()
+
+def kb_suggestions(text: str):
+    db = SessionLocal()
+    try:
+        with span("kb_suggest"):
+            return api.kb_engine.suggest(db, text, top_k=3)
+    except Exception as e:
+        print("KB suggestion error:", e)
+        metrics.errors.inc("kb_suggest")
+        return []
+    finally:
+        db.close()
+
+@router.post("/tickets/ingest")
+async def ingest_ticket(
+    payload: api.IngestTicket,
+    idempotency_key: Optional[str] = Header(default=None),
+    db: AsyncSession = Depends(get_async_db),
+):
+    existing = await find_existing(db, payload.channel, payload.source_ref, idempotency_key)
+    if existing:
+        return api.duplicate_response(existing)
+
+    cls = await run_in_threadpool(api.safe_classify, payload.subject + "\n" + payload.body)
+    with span("route"):
+        route = route_ticket(cls["category"], payload.urgency, cls.get("confidence"))
+    if api.routing_prior.built:
+        route = api.apply_historical_prior(None, cls["category"], route, cls.get("confidence"))
+    else:
+        route = await run_in_threadpool(prior_with_session, cls["category"], route, cls.get("confidence"))
+
+    try:
+        ticket, queued = await run_write(db, lambda wdb: api.insert_ticket(wdb, payload, cls, route, idempotency_key))
+    except IntegrityError:
+        await db.rollback()
+        existing = await find_existing(db, payload.channel, payload.source_ref, idempotency_key)
+        if existing:
+            return api.duplicate_response(existing)
+        raise
+    api.routing_prior.add(ticket.category, ticket.assignee_team, ticket.priority)
+    api.ticket_stats.add(api.stats_key(ticket), ticket.created_at)
+    api.response_cache.invalidate(api.HEAD_PAGES)
+    api.event_hub.publish("ticket_created", ticket.to_dict())
+    if queued:
+        api.send_notifications(ticket, api.CREATED_EVENTS, queued=True)
+    else:
+        await run_in_threadpool(api.send_notifications, ticket, api.CREATED_EVENTS)
+
+    suggestions = []
+    if api.kb_engine and not api.KB_DISABLED:
+        suggestions = await run_in_threadpool(kb_suggestions, f"{payload.subject} {payload.body}")
+
+    return {
+        "ticket": ticket.to_dict(),
+        "classification": cls,
+        "routing": {
+            "team": ticket.assignee_team,
+            "priority": ticket.priority,
+            "assignee_user": ticket.assignee_user,
+            **({"prior_applied": True} if "prior_applied" in route else {})
+        },
+        "kb_suggestions": suggestions
+    }
+
+@router.get("/tickets")
+async def list_tickets(
+    request: Request,
+    limit: int = 50,
+    offset: int = 0,
+    status: Optional[str] = None,
+    team: Optional[str] = None,
+    priority: Optional[str] = None,
+    category: Optional[str] = None,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    hit = api.cached_response(request)
+    if hit:
+        return hit
+    generation = api.response_cache.generation
+    names = api.parse_fields(fields)
+    stmt = api.ticket_select(names, status, team, priority, category)
+    if cursor:
+        created_at, tid = api.decode_cursor(cursor)
+        stmt = stmt.where(or_(
+            Ticket.created_at < created_at,
+            and_(Ticket.created_at == created_at, Ticket.id < tid),
+        ))
+    elif offset:
+        stmt = stmt.offset(offset)
+    rows = (await db.execute(stmt.limit(limit))).all()
+    headers = {}
+    if rows and len(rows) == limit:
+        next_cursor = api.encode_cursor(rows[-1])
+        if next_cursor:
+            headers["X-Next-Cursor"] = next_cursor
+    tags = api.list_tags(rows, cursor, status=status, category=category, team=team, priority=priority)
+    return api.store_response(request, [api.row_dict(r, names) for r in rows], tags, generation, headers)
+
+@router.get("/tickets/{ticket_id}")
+async def get_ticket(ticket_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    hit = api.cached_response(request)
+    if hit:
+        return hit
+    generation = api.response_cache.generation
+    t = await db.get(Ticket, ticket_id)
+    if not t:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    return api.store_response(request, t.to_dict(), [f"ticket:{t.id}"], generation)
+
+# Same role as main.update_locks, without blocking the event loop
+update_locks = [asyncio.Lock() for _ in range(api.UPDATE_LOCK_STRIPES)]
+
+@router.patch("/tickets/{ticket_id}")
+async def update_ticket(ticket_id: int, payload: api.UpdateTicket, db: AsyncSession = Depends(get_async_db)):
+    async with update_locks[ticket_id % api.UPDATE_LOCK_STRIPES]:
+        result = await run_write(db, lambda wdb: api.apply_ticket_update(wdb, ticket_id, payload))
+    if not result:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    t, before, after, notify, queued = result
+    api.track_update(before, after, t, assigned=notify)
+    if notify:
+        if queued:
+            api.send_notifications(t, api.ASSIGNED_EVENTS, queued=True)
+        else:
+            await run_in_threadpool(api.send_notifications, t, api.ASSIGNED_EVENTS)
+    return t.to_dict()
@@ -0,0 +1,184 @@
+import os
+import re
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from .models import SessionLocal, KnowledgeBase
+
+# Intent definitions: a JSON list of {name, keywords, exclude?, answer?, action?},
+# checked in order. KB articles' tags are appended as further intents.
+CHAT_INTENTS_PATH = os.getenv("CHAT_INTENTS_PATH", os.path.join(os.path.dirname(__file__), "chat_intents.json"))
+CHAT_KB_INTENTS = os.getenv("CHAT_KB_INTENTS", "true").lower() == "true"
+# Messages no intent matches are answered from the best KB article above this score
+CHAT_KB_MIN_SCORE = float(os.getenv("CHAT_KB_MIN_SCORE", "0.2"))
+CHAT_CACHE_SIZE = int(os.getenv("CHAT_CACHE_SIZE", "1024"))
+CHAT_SESSION_TTL = int(os.getenv("CHAT_SESSION_TTL", "1800"))
+CHAT_MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", "10000"))
+CHAT_HISTORY = int(os.getenv("CHAT_HISTORY", "5"))
+
+FALLBACK = "I can help with password, VPN, Outlook, printer. Describe your issue or say 'create ticket'."
+
+def normalize(text: str) -> str:
+    return " ".join(re.sub(r"[^\w]+", " ", (text or "").lower()).split())
+
+class LRUCache:
+    def __init__(self, size: int = CHAT_CACHE_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if self.size <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+class SessionStore:
+    # session_id -> conversation state; idle sessions expire after `ttl`
+    # seconds and the least recently used go first once `max_sessions` is hit
+    def __init__(self, ttl: int = CHAT_SESSION_TTL, max_sessions: int = CHAT_MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def get(self, session_id: str) -> Dict:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.pop(session_id, None)
+            if entry is None or entry[0] < now:
+                entry = (0, {"history": [], "turn": 0})
+            self._data[session_id] = (now + self.ttl, entry[1])
+            # Oldest first, so expired sessions are at the front
+            while self._data:
+                sid, (expires, _) = next(iter(self._data.items()))
+                if expires >= now and len(self._data) <= self.max_sessions:
+                    break
+                del self._data[sid]
+            return entry[1]
+
+    def __len__(self):
+        return len(self._data)
+
+class IntentMatcher:
+    # All keywords of all intents go into one alternation, so a message is
+    # scanned once however many intents there are; the first intent (in
+    # definition order) with a keyword hit and no excluded word wins
+    def __init__(self, intents: List[Dict]):
+        self.intents = []
+        words = set()
+        for intent in intents:
+            keywords = {normalize(k) for k in intent.get("keywords", [])} - {""}
+            exclude = {normalize(k) for k in intent.get("exclude", [])} - {""}
+            if keywords:
+                self.intents.append((intent, keywords, exclude))
+                words |= keywords | exclude
+        words = sorted(words, key=len, reverse=True)
+        self._pattern = re.compile(r"\b(?:" + "|".join(map(re.escape, words)) + ")") if words else None
+
+    def match(self, text: str) -> Optional[Dict]:
+        if not self._pattern:
+            return None
+        found = set(self._pattern.findall(text))
+        if not found:
+            return None
+        for intent, keywords, exclude in self.intents:
+            if found & keywords and not found & exclude:
+                return intent
+        return None
+
+def load_intents(path: str = CHAT_INTENTS_PATH) -> List[Dict]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print("Chat intents load error:", e)
+        return []
+
+def kb_intents(db) -> List[Dict]:
+    intents = []
+    for a in db.query(KnowledgeBase).order_by(KnowledgeBase.id):
+        tags = [t.strip() for t in (a.tags or "").split(",") if t.strip()]
+        if tags:
+            intents.append({"name": f"kb:{a.id}", "keywords": tags, "answer": f"{a.title}: {a.content} 'create ticket' to escalate.", "kb_id": a.id})
+    return intents
+
+class ChatEngine:
+    def __init__(self, kb_engine=None):
+        self.kb_engine = kb_engine
+        self.cache = LRUCache()
+        self._lock = threading.Lock()
+        self._matcher = None
+
+    def matcher(self) -> IntentMatcher:
+        with self._lock:
+            if self._matcher is None:
+                intents = load_intents()
+                if CHAT_KB_INTENTS:
+                    db = SessionLocal()
+                    try:
+                        intents += kb_intents(db)
+                    except Exception as e:
+                        print("Chat KB intents error:", e)
+                    finally:
+                        db.close()
+                self._matcher = IntentMatcher(intents)
+            return self._matcher
+
+    def invalidate(self):
+        # KB articles changed: rebuild intents and forget cached answers
+        with self._lock:
+            self._matcher = None
+        self.cache.clear()
+
+    def reply(self, message: str) -> Dict:
+        text = normalize(message)
+        cached = self.cache.get(text)
+        if cached is not None:
+            return cached
+        intent = self.matcher().match(text)
+        if intent and intent.get("action"):
+            # Actions depend on the session, so they are never cached
+            return {"response": None, "resolved": False, "intent": intent["name"], "action": intent["action"]}
+        if intent:
+            result = {"response": intent.get("answer") or FALLBACK, "resolved": True, "intent": intent["name"]}
+        else:
+            result = self.kb_answer(message) or {"response": FALLBACK, "resolved": False, "intent": None}
+        self.cache.put(text, result)
+        return result
+
+    def kb_answer(self, message: str) -> Optional[Dict]:
+        if not self.kb_engine or not message.strip():
+            return None
+        db = SessionLocal()
+        try:
+            hits = self.kb_engine.suggest(db, message, top_k=1, min_score=CHAT_KB_MIN_SCORE)
+            if not hits:
+                return None
+            a = db.get(KnowledgeBase, hits[0]["id"])
+            if not a:
+                return None
+            return {"response": f"{a.title}: {a.content} 'create ticket' to escalate.", "resolved": True,
+                    "intent": "kb_answer", "kb_id": a.id}
+        except Exception as e:
+            print("Chat KB answer error:", e)
+            return None
+        finally:
+            db.close()
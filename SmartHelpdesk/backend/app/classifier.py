@@ -1,4 +1,6 @@
-from typing import Dict
+import os
+import re
+from typing import Dict, List, Set
 
 CATEGORIES = ["password", "vpn", "email_outlook", "printer", "network", "hardware", "software", "access_request", "other"]
 
@@ -13,18 +15,94 @@ RULES = {
     "access_request": ["access", "permission", "authorization", "role", "entitlement"]
 }
 
+# true = keywords only match whole words ("lan" no longer hits "plan")
+RULES_WORD_BOUNDARY = os.getenv("RULES_WORD_BOUNDARY", "false").lower() == "true"
+
+# Trained model (tools/train_classifier.py); rules are used when it is missing
+# or its top class probability is below CLASSIFIER_MIN_CONFIDENCE
+CLASSIFIER_MODEL_PATH = os.getenv("CLASSIFIER_MODEL_PATH", "./classifier_model.joblib")
+CLASSIFIER_MIN_CONFIDENCE = float(os.getenv("CLASSIFIER_MIN_CONFIDENCE", "0.6"))
+
+class RuleMatcher:
+    # RULES compiled once: each distinct keyword is scanned at most once per
+    # text, shortest first, and a keyword whose contained keywords are already
+    # known absent is skipped ("jam" missing means "paper jam" is too).
+    # CPython's substring search is far faster than re alternation over the
+    # same keywords, so the scans stay on str.__contains__.
+    def __init__(self, rules: Dict[str, List[str]], word_boundary: bool = False):
+        self.rules = {cat: [k.lower() for k in keys] for cat, keys in rules.items()}
+        keywords = sorted({k for keys in self.rules.values() for k in keys}, key=len)
+        # (keyword, keywords it contains or None, whether others contain it)
+        self.plan = [
+            (
+                k,
+                frozenset(j for j in keywords if j != k and j in k) or None,
+                any(k != j and k in j for j in keywords),
+            )
+            for k in keywords
+        ]
+        # keyword -> categories listing it, with multiplicity like the RULES lists
+        self.categories_of = {}
+        for cat, keys in self.rules.items():
+            for k in keys:
+                self.categories_of.setdefault(k, []).append(cat)
+        self.word_boundary = word_boundary
+        self.patterns = {k: re.compile(rf"\b{re.escape(k)}\b") for k in keywords} if word_boundary else {}
+
+    def found(self, t: str) -> Set[str]:
+        present, absent = set(), set()
+        for k, inner, tracked in self.plan:
+            if (inner is not None and not absent.isdisjoint(inner)) or k not in t:
+                if tracked:
+                    absent.add(k)
+            elif not self.word_boundary or self.patterns[k].search(t):
+                present.add(k)
+        return present
+
+    def scores(self, text: str) -> Dict[str, int]:
+        counts = {}
+        for k in self.found((text or "").lower()):
+            for cat in self.categories_of[k]:
+                counts[cat] = counts.get(cat, 0) + 1
+        # Re-keyed in RULES order so max() breaks ties exactly as before
+        return {cat: counts[cat] for cat in self.rules if cat in counts}
+
+_matcher = RuleMatcher(RULES, RULES_WORD_BOUNDARY)
+
 def classify_by_rules(text: str) -> Dict:
-    t = (text or "").lower()
-    scores = {}
-    for cat, keys in RULES.items():
-        score = sum(1 for k in keys if k in t)
-        if score > 0:
-            scores[cat] = score
+    scores = _matcher.scores(text)
     if not scores:
         return {"category": "other", "confidence": 0.3}
     category = max(scores, key=scores.get)
     conf = min(0.9, 0.4 + 0.1 * scores[category])
     return {"category": category, "confidence": conf}
 
+_loader = None
+
+def get_model():
+    # sklearn is only imported once a model file actually exists
+    global _loader
+    if _loader is None:
+        if not CLASSIFIER_MODEL_PATH or not os.path.exists(CLASSIFIER_MODEL_PATH):
+            return None
+        from .ml_classifier import ModelLoader
+        _loader = ModelLoader(CLASSIFIER_MODEL_PATH)
+    return _loader.get()
+
+def classify_many(texts: List[str]) -> List[Dict]:
+    results = [None] * len(texts)
+    model = get_model()
+    if model is not None and texts:
+        try:
+            for i, (category, prob) in enumerate(model.predict([t or "" for t in texts])):
+                if prob >= CLASSIFIER_MIN_CONFIDENCE:
+                    results[i] = {"category": category, "confidence": round(prob, 4), "method": "model", "model_version": model.version}
+        except Exception as e:
+            print("Model classification error:", e)
+    for i, r in enumerate(results):
+        if r is None:
+            results[i] = {**classify_by_rules(texts[i]), "method": "rules"}
+    return results
+
 def classify_text(text: str) -> Dict:
-    return classify_by_rules(text)
\ No newline at end of file
+    return classify_many([text])[0]
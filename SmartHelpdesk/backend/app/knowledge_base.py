@@ -1,34 +1,358 @@
-from typing import List, Dict
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import os
+import json
+import shutil
+import hashlib
+import threading
+from typing import List, Dict, Optional
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+from sklearn.utils.sparsefuncs_fast import inplace_csr_row_normalize_l2
+
+KB_HASH_FEATURES = int(os.getenv("KB_HASH_FEATURES", str(2 ** 18)))
+# Articles added/updated/deleted before global IDF weights are recomputed
+KB_COMPACT_EVERY = int(os.getenv("KB_COMPACT_EVERY", "256"))
+# On-disk index snapshot (empty disables); reused on startup while the KB is unchanged
+KB_SNAPSHOT_DIR = os.getenv("KB_SNAPSHOT_DIR", "./kb_index")
+# Suggestions must score above this (0 keeps any article sharing a term)
+KB_MIN_SCORE = float(os.getenv("KB_MIN_SCORE", "0"))
+# Queries vectorised and scored together per sparse product in suggest_many
+KB_BATCH_SIZE = int(os.getenv("KB_BATCH_SIZE", "1024"))
+SNAPSHOT_FORMAT = 2
+
+def _doc(title: str, content: str) -> str:
+    return f"{title}. {content}"
+
+def kb_content_hash(db) -> str:
+    from .models import KnowledgeBase
+    h = hashlib.sha256()
+    q = db.query(KnowledgeBase.id, KnowledgeBase.title, KnowledgeBase.content).order_by(KnowledgeBase.id)
+    for r in q.yield_per(1000):
+        h.update(f"{r.id}\x1f{r.title}\x1f{r.content}\x1e".encode("utf-8", "surrogatepass"))
+    return h.hexdigest()
+
+def select_top_k(rows: np.ndarray, scores: np.ndarray, k: int):
+    # O(n) selection with argpartition, then sorts only the k winners
+    if k <= 0 or len(scores) == 0:
+        return rows[:0], scores[:0]
+    if len(scores) > k:
+        part = np.argpartition(scores, -k)[-k:]
+        rows, scores = rows[part], scores[part]
+    order = np.argsort(-scores, kind="stable")
+    return rows[order], scores[order]
+
+class StrArray:
+    # Immutable list of strings stored as one UTF-8 buffer plus offsets, so it
+    # can be saved with np.save and memory-mapped back
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def from_list(cls, values: List[str]) -> "StrArray":
+        encoded = [(v or "").encode("utf-8") for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
 
 class KBEngine:
-    def __init__(self):
-        self.vectorizer = None
-        self.matrix = None
-        self.records = []
+    # TF-IDF over a stateless HashingVectorizer, so articles can be added or
+    # removed without refitting a vocabulary. Document frequencies are kept
+    # current on every change; IDF weights are frozen between compactions and
+    # new rows go into a tail block that compaction merges into the main one.
+    name = "tfidf"
+
+    def __init__(self, n_features: int = KB_HASH_FEATURES):
+        self.vectorizer = HashingVectorizer(
+            stop_words="english", n_features=n_features, alternate_sign=False, norm=None
+        )
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        n = self.vectorizer.n_features
+        self.df = np.zeros(n, dtype=np.int64)
+        self.idf = None
+        self._query_idf = None
+        self.tf = sp.csr_matrix((0, n))      # raw term counts, compacted rows
+        self.matrix = sp.csc_matrix((0, n))  # L2-normalised TF-IDF, compacted rows, column-major
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.titles = StrArray.from_list([])
+        self._tail_tf = []
+        self._tail_matrix = None
+        self._tail_ids = []
+        self._tail_titles = []
+        self.dead = set()    # tombstoned row numbers
+        self._row_of = None  # kb id -> row, built on first edit
+        self._mutations = 0
+        self.built = False
+
+    def _n_rows(self) -> int:
+        return len(self.ids) + len(self._tail_ids)
+
+    def _n_live(self) -> int:
+        return self._n_rows() - len(self.dead)
+
+    def _compute_idf(self) -> np.ndarray:
+        # Same smoothing as TfidfVectorizer's default
+        return np.log((1 + self._n_live()) / (1 + self.df)) + 1.0
+
+    def _weigh(self, tf):
+        return normalize(tf @ sp.diags(self.idf), copy=False).tocsr()
+
+    def _set_compacted(self, tf, ids: np.ndarray, titles: StrArray):
+        self.tf = tf
+        self.ids = ids
+        self.titles = titles
+        self._tail_tf, self._tail_ids, self._tail_titles = [], [], []
+        self._tail_matrix = None
+        self.dead = set()
+        self._row_of = None
+        self.df = np.bincount(tf.indices, minlength=self.vectorizer.n_features)
+        self.idf = self._compute_idf() if len(ids) else None
+        # Column-major so each term's postings are contiguous for scoring
+        self.matrix = self._weigh(tf).tocsc() if len(ids) else sp.csc_matrix((0, tf.shape[1]))
+        self._query_idf = None
+        self._mutations = 0
 
     def build_index(self, db):
         from .models import KnowledgeBase
-        self.records = db.query(KnowledgeBase).all()
-        corpus = [f"{r.title}. {r.content}" for r in self.records]
-        if len(corpus) == 0:
-            self.vectorizer = None
-            self.matrix = None
+        rows = db.query(KnowledgeBase.id, KnowledgeBase.title, KnowledgeBase.content).order_by(KnowledgeBase.id).all()
+        tf = self.vectorizer.transform([_doc(r.title, r.content) for r in rows]).tocsr() if rows else None
+        with self._lock:
+            self._reset()
+            if rows:
+                self._set_compacted(
+                    tf, np.array([r.id for r in rows], dtype=np.int64), StrArray.from_list([r.title for r in rows])
+                )
+            self.built = True
+
+    def load_or_build(self, db, path: str = KB_SNAPSHOT_DIR):
+        if not path:
+            self.build_index(db)
+            return
+        content_hash = kb_content_hash(db)
+        if self.load(path, content_hash):
+            print("KB index loaded from snapshot.")
             return
-        self.vectorizer = TfidfVectorizer(stop_words="english")
-        self.matrix = self.vectorizer.fit_transform(corpus)
+        self.build_index(db)
+        try:
+            self.save(path, content_hash)
+        except Exception as e:
+            print("KB snapshot save failed:", e)
+
+    def save(self, path: str, content_hash: str):
+        # Each snapshot gets its own directory and CURRENT is swapped atomically,
+        # so concurrent workers never read a half-written one
+        with self._lock:
+            self.compact()
+            tf, matrix, df, idf, ids, titles = self.tf, self.matrix, self.df, self.idf, self.ids, self.titles
+            extra = self._extra_arrays()
+        name = f"v{SNAPSHOT_FORMAT}-{content_hash[:16]}"
+        target = os.path.join(path, name)
+        tmp = f"{target}.tmp{os.getpid()}"
+        os.makedirs(tmp, exist_ok=True)
+        arrays = {
+            "ids": ids, "titles_blob": titles.blob, "titles_offsets": titles.offsets, "df": df,
+            "tf_data": tf.data, "tf_indices": tf.indices, "tf_indptr": tf.indptr,
+            "m_data": matrix.data, "m_indices": matrix.indices, "m_indptr": matrix.indptr,
+        }
+        if idf is not None:
+            arrays["idf"] = idf
+        arrays.update(extra)
+        for key, arr in arrays.items():
+            np.save(os.path.join(tmp, f"{key}.npy"), np.ascontiguousarray(arr))
+        meta = {
+            "format": SNAPSHOT_FORMAT,
+            "content_hash": content_hash,
+            "n_features": self.vectorizer.n_features,
+            "rows": int(len(ids)),
+            "engine": self.name,
+            "extra": sorted(extra),
+        }
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp, target)
+        current_tmp = os.path.join(path, f"CURRENT.tmp{os.getpid()}")
+        with open(current_tmp, "w") as f:
+            f.write(name)
+        os.replace(current_tmp, os.path.join(path, "CURRENT"))
+        for entry in os.listdir(path):
+            if entry.startswith(f"v{SNAPSHOT_FORMAT}-") and entry != name and ".tmp" not in entry:
+                shutil.rmtree(os.path.join(path, entry), ignore_errors=True)
+
+    def load(self, path: str, content_hash: Optional[str] = None) -> bool:
+        try:
+            with open(os.path.join(path, "CURRENT")) as f:
+                target = os.path.join(path, f.read().strip())
+            with open(os.path.join(target, "meta.json")) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if meta.get("format") != SNAPSHOT_FORMAT or meta.get("n_features") != self.vectorizer.n_features:
+            return False
+        if meta.get("engine", "tfidf") != self.name:
+            return False
+        if content_hash is not None and meta.get("content_hash") != content_hash:
+            return False
+
+        # Read-only mappings are shared between worker processes; df is
+        # copy-on-write because edits update it in place
+        def arr(key, mode="r"):
+            return np.load(os.path.join(target, f"{key}.npy"), mmap_mode=mode)
+
+        rows, n = meta["rows"], self.vectorizer.n_features
+        try:
+            tf = sp.csr_matrix((arr("tf_data"), arr("tf_indices"), arr("tf_indptr")), shape=(rows, n), copy=False)
+            matrix = sp.csc_matrix((arr("m_data"), arr("m_indices"), arr("m_indptr")), shape=(rows, n), copy=False)
+            ids = arr("ids")
+            titles = StrArray(arr("titles_blob"), arr("titles_offsets"))
+            df = arr("df", "c")
+            idf = arr("idf") if rows else None
+            extra = {key: arr(key) for key in meta.get("extra", [])}
+        except (OSError, ValueError) as e:
+            print("KB snapshot load failed:", e)
+            return False
+        with self._lock:
+            self._reset()
+            self.tf, self.matrix, self.ids, self.titles, self.df, self.idf = tf, matrix, ids, titles, df, idf
+            self._restore_extra(extra)
+            self.built = True
+        return True
+
+    # Hooks for engines that keep derived structures in the snapshot
+    def _extra_arrays(self) -> Dict[str, np.ndarray]:
+        return {}
+
+    def _restore_extra(self, arrays: Dict[str, np.ndarray]):
+        pass
+
+    def _row_index(self) -> Dict[int, int]:
+        if self._row_of is None:
+            row_of = {int(kb_id): i for i, kb_id in enumerate(self.ids)}
+            for j, kb_id in enumerate(self._tail_ids):
+                row_of[kb_id] = len(self.ids) + j
+            self._row_of = {k: v for k, v in row_of.items() if v not in self.dead}
+        return self._row_of
+
+    def add(self, kb_id: int, title: str, content: str):
+        # Also used for updates: the old row is tombstoned and a new one appended
+        row = self.vectorizer.transform([_doc(title, content)]).tocsr()
+        with self._lock:
+            row_of = self._row_index()
+            if kb_id in row_of:
+                self._remove(kb_id)
+            self.df[row.indices] += 1
+            row_of[kb_id] = self._n_rows()
+            self._tail_ids.append(kb_id)
+            self._tail_titles.append(title)
+            if self.idf is None:
+                self.idf = self._compute_idf()
+            self._tail_tf.append(row)
+            self._tail_matrix = None
+            self._query_idf = None
+            self._touch()
+
+    def update(self, kb_id: int, title: str, content: str):
+        self.add(kb_id, title, content)
+
+    def delete(self, kb_id: int):
+        with self._lock:
+            if kb_id in self._row_index():
+                self._remove(kb_id)
+                self._touch()
+
+    def _remove(self, kb_id: int):
+        i = self._row_index().pop(kb_id)
+        self.dead.add(i)
+        self.df[self._tf_row(i).indices] -= 1
+        self._query_idf = None
+
+    def _tf_row(self, i: int):
+        n = self.tf.shape[0]
+        return self.tf[i] if i < n else self._tail_tf[i - n]
+
+    def _touch(self):
+        self._mutations += 1
+        if self._mutations >= KB_COMPACT_EVERY:
+            self.compact()
+
+    def compact(self):
+        # Drops tombstoned rows, merges the tail and recomputes IDF weights
+        with self._lock:
+            if not self._tail_ids and not self.dead:
+                return
+            live = np.array([i for i in range(self._n_rows()) if i not in self.dead], dtype=np.int64)
+            n = len(self.ids)
+            tf = sp.vstack([self.tf] + self._tail_tf, format="csr")[live]
+            ids = np.concatenate([np.asarray(self.ids), np.array(self._tail_ids, dtype=np.int64)])[live]
+            titles = StrArray.from_list([self.titles[i] if i < n else self._tail_titles[i - n] for i in live])
+            self._set_compacted(tf, ids, titles)
+
+    def _snapshot(self):
+        with self._lock:
+            if self._tail_tf and self._tail_matrix is None:
+                self._tail_matrix = self._weigh(sp.vstack(self._tail_tf, format="csr"))
+            if self.idf is not None and self._query_idf is None:
+                # Terms no live article contains are dropped from queries, like
+                # out-of-vocabulary terms in a fitted TfidfVectorizer
+                self._query_idf = self.idf * (self.df > 0)
+            blocks = [self.matrix] + ([self._tail_matrix] if self._tail_tf else [])
+            # Compaction rebinds these instead of mutating them, and tail lists
+            # are append-only, so row numbers stay valid for this query
+            rows = (self.ids, self.titles, self._tail_ids, self._tail_titles)
+            return blocks, self._query_idf, list(self.dead), self._n_live(), rows
+
+    def _queries(self, texts: List[str], query_idf: np.ndarray):
+        q = self.vectorizer.transform(texts).tocsr()
+        q.data = q.data * query_idf[q.indices]
+        q.eliminate_zeros()
+        inplace_csr_row_normalize_l2(q)
+        return q
+
+    def _score(self, blocks, q, dead, min_score: float):
+        # Rows are L2-normalised, so the sparse product is the cosine score.
+        # q @ b.T only walks the postings of the query terms; each query row of
+        # the result holds just the articles sharing a term with it
+        hits = [q @ b.T for b in blocks]
+        hits = hits[0].tocsr() if len(hits) == 1 else sp.hstack(hits, format="csr")
+        dead_rows = np.array(dead, dtype=np.int64)
+        for r in range(hits.shape[0]):
+            lo, hi = hits.indptr[r], hits.indptr[r + 1]
+            rows, scores = hits.indices[lo:hi].astype(np.int64), hits.data[lo:hi]
+            keep = scores > min_score
+            if len(dead_rows):
+                keep &= ~np.isin(rows, dead_rows)
+            yield rows[keep], scores[keep]
+
+    def suggest(self, db, text: str, top_k: int = 3, min_score: float = KB_MIN_SCORE) -> List[Dict]:
+        return self.suggest_many(db, [text], top_k, min_score)[0]
 
-    def suggest(self, db, text: str, top_k: int = 3) -> List[Dict]:
-        if self.vectorizer is None or self.matrix is None:
+    def suggest_many(self, db, texts: List[str], top_k: int = 3, min_score: float = KB_MIN_SCORE) -> List[List[Dict]]:
+        if not self.built:
             self.build_index(db)
-        if self.vectorizer is None or self.matrix is None:
-            return []
-        q = self.vectorizer.transform([text])
-        sim = cosine_similarity(q, self.matrix).flatten()
-        idxs = sim.argsort()[::-1][:top_k]
-        out = []
-        for i in idxs:
-            r = self.records[i]
-            out.append({"id": r.id, "title": r.title, "score": float(sim[i])})
-        return out
\ No newline at end of file
+        blocks, query_idf, dead, n_live, (ids, titles, tail_ids, tail_titles) = self._snapshot()
+        if query_idf is None or n_live == 0:
+            return [[] for _ in texts]
+        n = len(ids)
+        results = []
+        # Chunked so a large backfill doesn't materialise one huge score matrix
+        for start in range(0, len(texts), KB_BATCH_SIZE):
+            q = self._queries(texts[start:start + KB_BATCH_SIZE], query_idf)
+            for cand_rows, cand_scores in self._score(blocks, q, dead, min_score):
+                out = []
+                for i, score in zip(*select_top_k(cand_rows, cand_scores, top_k)):
+                    if i < n:
+                        out.append({"id": int(ids[i]), "title": titles[i], "score": float(score)})
+                    else:
+                        out.append({"id": tail_ids[i - n], "title": tail_titles[i - n], "score": float(score)})
+                results.append(out)
+        return results
@@ -0,0 +1,32 @@
+import threading
+from typing import Callable
+
+class Lazy:
+    # Stands in for the object `factory` returns and builds it on first
+    # attribute access, so importing the module that holds it doesn't pull in
+    # the object's heavy dependencies (sklearn/numpy for the KB engine)
+    def __init__(self, factory: Callable):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._obj = None
+        self._error = None
+
+    def _get(self):
+        if self._obj is None:
+            with self._lock:
+                if self._obj is None:
+                    if self._error is not None:
+                        raise self._error
+                    try:
+                        self._obj = self._factory()
+                    except Exception as e:
+                        self._error = e
+                        raise
+        return self._obj
+
+    @property
+    def loaded(self) -> bool:
+        return self._obj is not None
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
@@ -1,46 +1,73 @@
 import os
+import io
+import csv
+import json
+import time
+import base64
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Optional, List, Dict
 
-from fastapi import FastAPI, HTTPException, Body
+from fastapi import FastAPI, HTTPException, Body, Header, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from sqlalchemy import func
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from sqlalchemy import func, insert, update, select, or_, and_
+from sqlalchemy.exc import IntegrityError
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from .models import init_db, SessionLocal, Ticket, KnowledgeBase
-from .classifier import classify_text
+from .models import init_db, engine, async_engine, liveness, SessionLocal, AsyncSessionLocal, SQLITE_PRODUCTION, Ticket, KnowledgeBase, NotificationOutbox
+from .pooling import DB_PRE_PING, pool_stats, pool_status
+from .classifier import classify_text, classify_many, get_model
 from .routing import route_ticket
+from . import metrics
+from .metrics import span
+from .routing_prior import RoutingPrior
+from .ticket_stats import TicketStats
+from .write_queue import WriteQueue
+from .chat_engine import ChatEngine, LRUCache, SessionStore, CHAT_HISTORY, CHAT_MAX_SESSIONS
+from .lazy import Lazy
+from .response_cache import ResponseCache, make_etag
+from .ticket_events import EventHub
 
 # Optional KB (can be disabled by env flags)
 KB_DISABLED = os.getenv("DISABLE_KB_INDEX", "false").lower() == "true"
 SEED_DISABLED = os.getenv("DISABLE_SEED", "false").lower() == "true"
-try:
-    if not KB_DISABLED:
-        from .knowledge_base import KBEngine
-    else:
-        KBEngine = None
-except Exception as e:
-    print("KBEngine import failed:", e)
-    KBEngine = None
+KB_ENGINE = os.getenv("KB_ENGINE", "exact").lower()
+# Serverless cold starts: schema setup, KB index and counters are prepared in
+# a background thread so the first requests don't wait for them
+FAST_STARTUP = os.getenv("FAST_STARTUP", "true" if os.getenv("VERCEL") else "false").lower() == "true"
+
+def load_kb_engine():
+    # sklearn/numpy are imported here, on first use of the KB, not with the app
+    try:
+        if KB_ENGINE == "ann":
+            from .ann_index import SemanticKBEngine as KBEngine
+        else:
+            from .knowledge_base import KBEngine
+    except Exception as e:
+        print("KBEngine import failed:", e)
+        raise
+    return KBEngine()
 
 # Notifications safe import
 try:
-    from .notifications import (
-        notify_ticket_created,
-        notify_assignment,
-        notify_requester_ticket_created,
-        notify_user_assignment,
-        notify_requester_assigned,
-        notify_contact_requester,
-    )
+    from .notifications import NOTIFIERS, close_transports
 except Exception as e:
     print("Notifications import failed:", e)
-    def _noop(*_, **__): pass
-    notify_ticket_created = notify_assignment = notify_requester_ticket_created = \
-        notify_user_assignment = notify_requester_assigned = notify_contact_requester = _noop
+    NOTIFIERS = {}
+    def close_transports(): pass
+
+try:
+    from . import outbox
+except Exception as e:
+    print("Outbox import failed:", e)
+    outbox = None
 
 app = FastAPI(title="Smart Helpdesk API", version="0.6.1-vercel")
 
@@ -50,9 +77,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 AUTO_ASSIGN = os.getenv("AUTO_ASSIGN", "false").lower() == "true"
+# Tickets per transaction in POST /tickets/ingest/bulk
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "500"))
+# Rows fetched per round trip while streaming /tickets/export
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+# Tickets requested from /chat are created by these background workers
+CHAT_INGEST_WORKERS = int(os.getenv("CHAT_INGEST_WORKERS", "2"))
 TEAMS_ROSTER_RAW = os.getenv("TEAMS_ROSTER", "")
 
 def parse_roster(raw: str) -> Dict[str, List[str]]:
@@ -68,7 +102,21 @@ def parse_roster(raw: str) -> Dict[str, List[str]]:
     return roster
 
 ROSTER = parse_roster(TEAMS_ROSTER_RAW)
-kb_engine = KBEngine() if KBEngine else None
+kb_engine = None if KB_DISABLED else Lazy(load_kb_engine)
+schema_ready = threading.Event()
+warmed_up = threading.Event()
+routing_prior = RoutingPrior()
+ticket_stats = TicketStats()
+response_cache = ResponseCache()
+event_hub = EventHub()
+chat_engine = ChatEngine(kb_engine)
+chat_sessions = SessionStore()
+# ticket_ref -> {"status": pending|created|failed, "ticket_id", "error"}
+chat_tickets = LRUCache(CHAT_MAX_SESSIONS)
+chat_ingest = ThreadPoolExecutor(max_workers=max(1, CHAT_INGEST_WORKERS), thread_name_prefix="chat-ingest")
+chat_ingest_lock = threading.Lock()
+chat_ingest_pending = 0  # submitted, not finished yet
+write_queue = WriteQueue(engine) if SQLITE_PRODUCTION else None
 
 class IngestTicket(BaseModel):
     subject: str
@@ -81,6 +129,9 @@ class IngestTicket(BaseModel):
 
 class ChatMessage(BaseModel):
     session_id: Optional[str] = None
+    # Client-generated id for this message; a resend with the same id (or
+    # Idempotency-Key header) returns the same ticket_ref
+    message_id: Optional[str] = None
     message: str
     user_email: Optional[str] = None
     user_phone: Optional[str] = None
@@ -91,11 +142,60 @@ class UpdateTicket(BaseModel):
     assignee_user: Optional[str] = None
     priority: Optional[str] = Field(default=None)
 
+class KBArticle(BaseModel):
+    title: str
+    content: str
+    tags: List[str] = Field(default_factory=list)
+
+class UpdateKBArticle(BaseModel):
+    title: Optional[str] = None
+    content: Optional[str] = None
+    tags: Optional[List[str]] = None
+
+class KBSuggestRequest(BaseModel):
+    text: Optional[str] = None
+    texts: List[str] = Field(default_factory=list)
+    top_k: int = Field(default=3, ge=1, le=50)
+
 @app.on_event("startup")
 def on_startup():
+    if liveness:
+        liveness.start()
+    if write_queue:
+        write_queue.start()
+    if FAST_STARTUP:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    else:
+        warm_up()
+
+class SchemaGate:
+    # Fast startup: requests that arrive while tables/migrations are still
+    # being set up wait for that (not for the KB or counters)
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not schema_ready.is_set() and scope["path"] not in ("/ping", "/health"):
+            await run_in_threadpool(schema_ready.wait, 30)
+        await self.app(scope, receive, send)
+
+app.add_middleware(SchemaGate)
+
+def warm_up():
     print("Startup: init_db")
     try:
-        init_db()
+        try:
+            init_db()
+        finally:
+            schema_ready.set()
+        db = SessionLocal()
+        try:
+            routing_prior.build(db)
+            ticket_stats.build(db)
+        except Exception as e:
+            print("Routing prior/stats build error:", e)
+        finally:
+            db.close()
         if kb_engine and not KB_DISABLED:
             db = SessionLocal()
             try:
@@ -126,7 +226,7 @@ def on_startup():
                     db.add_all(seed)
                     db.commit()
                 print("Building KB index...")
-                kb_engine.build_index(db)
+                kb_engine.load_or_build(db)
             except Exception as e:
                 print("KB init error:", e)
             finally:
@@ -135,6 +235,23 @@ def on_startup():
             print("KB disabled.")
     except Exception as e:
         print("Startup error (non-fatal):", e)
+    finally:
+        # Whatever failed above, queued notifications still get delivered
+        if outbox and outbox.NOTIFY_ASYNC:
+            outbox.worker.start()
+        warmed_up.set()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    # Chat tickets still queued are written before the writer stops
+    chat_ingest.shutdown(wait=True)
+    if outbox:
+        outbox.worker.stop()
+    if write_queue:
+        write_queue.stop()
+    if liveness:
+        liveness.stop()
+    close_transports()
 
 @app.get("/ping")
 def ping():
@@ -146,23 +263,76 @@ def health():
         "status": "ok",
         "time": datetime.utcnow().isoformat(),
         "kb_enabled": not KB_DISABLED,
+        "kb_engine": kb_engine.name if kb_engine and kb_engine.loaded else None,
+        "warmed_up": warmed_up.is_set(),
+        "event_stream": {"subscribers": len(event_hub), "dropped": event_hub.dropped},
+        "response_cache": {"hits": response_cache.hits, "misses": response_cache.misses} if response_cache.backend else None,
+        "classifier_model": getattr(get_model(), "version", None),
+        "db_mode": "async" if AsyncSessionLocal else "sync",
+        "sqlite_writer": {"batches": write_queue.batches, "writes": write_queue.writes} if write_queue else None,
         "seed_disabled": SEED_DISABLED,
         "auto_assign": AUTO_ASSIGN
     }
 
+@app.get("/metrics/db")
+def db_metrics():
+    # Pool occupancy now, plus checkout wait times (Postgres/MySQL pools)
+    return {
+        "pool": pool_status(engine),
+        "async_pool": pool_status(async_engine.sync_engine) if async_engine else None,
+        "checkout": pool_stats.snapshot(),
+        "pre_ping": DB_PRE_PING,
+    }
+
+def outbox_pending():
+    if not outbox:
+        return None
+    db = SessionLocal()
+    try:
+        return db.query(func.count(NotificationOutbox.id)).filter(NotificationOutbox.status == "pending").scalar()
+    finally:
+        db.close()
+
+def checkout_waits():
+    snap = pool_stats.snapshot()
+    return {q: snap[f"wait_ms_{name}"] / 1000 for q, name in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99"), ("1", "max"))}
+
+metrics.gauge("helpdesk_outbox_pending", "Notification outbox rows waiting to be sent", outbox_pending)
+metrics.gauge("helpdesk_outbox_inflight", "Outbox rows being sent right now", lambda: outbox.worker.pending() if outbox else None)
+metrics.gauge("helpdesk_write_queue_depth", "Writes waiting for the SQLite writer thread", lambda: write_queue.depth() if write_queue else None)
+metrics.gauge("helpdesk_chat_ingest_pending", "Chat tickets submitted for background ingest and not finished yet", lambda: chat_ingest_pending)
+metrics.gauge("helpdesk_event_subscribers", "Open /tickets/stream connections", lambda: len(event_hub))
+metrics.gauge("helpdesk_event_streams_dropped_total", "Streams closed for falling behind", lambda: event_hub.dropped, kind="counter")
+metrics.gauge("helpdesk_response_cache_requests_total", "Response cache lookups", lambda: {"hit": response_cache.hits, "miss": response_cache.misses} if response_cache.backend else None, "result", "counter")
+metrics.gauge("helpdesk_db_pool_connections", "Connection pool occupancy (Postgres/MySQL)", lambda: pool_status(engine), "state")
+metrics.gauge("helpdesk_db_checkouts_total", "Pool checkouts, and ones that timed out", lambda: {"ok": pool_stats.checkouts, "timeout": pool_stats.timeouts}, "result", "counter")
+metrics.gauge("helpdesk_db_checkout_wait_seconds", "Pool checkout wait over recent checkouts", checkout_waits, "quantile")
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 def apply_historical_prior(db, category: str, current_route: dict, confidence: Optional[float]):
+    with span("prior"):
+        return _historical_prior(db, category, current_route, confidence)
+
+def _historical_prior(db, category: str, current_route: dict, confidence: Optional[float]):
     try:
-        row = (
-            db.query(Ticket.assignee_team, Ticket.priority, func.count().label("c"))
-            .filter(Ticket.category == category, Ticket.assignee_team != None)
-            .group_by(Ticket.assignee_team, Ticket.priority)
-            .order_by(func.count().desc())
-            .first()
-        )
+        if routing_prior.built:
+            row = routing_prior.best(category)
+        else:
+            row = (
+                db.query(Ticket.assignee_team, Ticket.priority, func.count().label("c"))
+                .filter(Ticket.category == category, Ticket.assignee_team != None)
+                .group_by(Ticket.assignee_team, Ticket.priority)
+                .order_by(func.count().desc())
+                .first()
+            )
         if row and (confidence or 0) < 0.7:
             return {"team": row[0] or current_route["team"], "priority": row[1] or current_route["priority"], "prior_applied": True}
     except Exception as e:
         print("Historical prior error:", e)
+        metrics.errors.inc("prior")
     return current_route
 
 def choose_assignee(team: str, ticket_id: int) -> Optional[str]:
@@ -172,61 +342,139 @@ def choose_assignee(team: str, ticket_id: int) -> Optional[str]:
     idx = (ticket_id - 1) % len(emails)
     return emails[idx]
 
+CREATED_EVENTS = ["ticket_created", "requester_ticket_created", "assignment", "user_assignment", "requester_assigned"]
+ASSIGNED_EVENTS = ["user_assignment", "requester_assigned"]
+
+def queue_notifications(db, ticket: Ticket, events: List[str], message: Optional[str] = None) -> bool:
+    # Stages outbox rows in the open transaction; False means send inline after commit
+    if not (outbox and outbox.NOTIFY_ASYNC):
+        return False
+    outbox.enqueue(db, ticket.id, events, message)
+    return True
+
+def send_notifications(ticket: Ticket, events: List[str], message: Optional[str] = None, queued: bool = False):
+    if queued:
+        outbox.worker.wake()
+        return
+    with span("notify"):
+        for event in events:
+            handler = NOTIFIERS.get(event)
+            if not handler:
+                continue
+            try:
+                if message is not None:
+                    handler(ticket, message)
+                else:
+                    handler(ticket)
+            except Exception as e:
+                print("Notification error:", e)
+                metrics.errors.inc("notify")
+
+def run_write(db, fn):
+    # fn(db) stages the writes; with the SQLite production profile it runs on
+    # the group-committing writer thread instead, otherwise in db right here
+    with span("db_commit"):
+        if write_queue:
+            return write_queue.submit(fn).result()
+        result = fn(db)
+        db.commit()
+        return result
+
 def safe_classify(text: str):
     try:
-        return classify_text(text)
+        with span("classify"):
+            return classify_text(text)
     except Exception as e:
         print("Classification error:", e)
+        metrics.errors.inc("classify")
         return {"category": "other", "confidence": 0.0, "error": str(e)}
 
+def find_existing(db, source: str, source_ref: Optional[str], key: Optional[str]) -> Optional[Ticket]:
+    # Both lookups are served by the unique indexes on tickets
+    if key:
+        t = db.query(Ticket).filter(Ticket.idempotency_key == key).first()
+        if t:
+            return t
+    if source_ref:
+        return db.query(Ticket).filter(Ticket.source == source, Ticket.source_ref == source_ref).first()
+    return None
+
+def duplicate_response(ticket: Ticket) -> Dict:
+    return {
+        "ticket": ticket.to_dict(),
+        "duplicate": True,
+        "classification": {"category": ticket.category},
+        "routing": {
+            "team": ticket.assignee_team,
+            "priority": ticket.priority,
+            "assignee_user": ticket.assignee_user,
+        },
+        "kb_suggestions": []
+    }
+
+def insert_ticket(db, payload: IngestTicket, cls: Dict, route: Dict, idempotency_key: Optional[str] = None):
+    ticket = Ticket(
+        created_at=datetime.utcnow(),
+        source=payload.channel,
+        source_ref=payload.source_ref,
+        user_email=payload.user_email,
+        user_phone=payload.user_phone,
+        subject=payload.subject,
+        body=payload.body,
+        category=cls["category"],
+        priority=route["priority"],
+        status="open",
+        assignee_team=route["team"],
+        assignee_user=None,
+        idempotency_key=idempotency_key
+    )
+    db.add(ticket)
+    db.flush()
+
+    if AUTO_ASSIGN:
+        with span("auto_assign"):
+            assignee = choose_assignee(ticket.assignee_team, ticket.id)
+        if assignee:
+            ticket.assignee_user = assignee
+
+    return ticket, queue_notifications(db, ticket, CREATED_EVENTS)
+
 @app.post("/tickets/ingest")
-def ingest_ticket(payload: IngestTicket):
+def ingest_ticket(payload: IngestTicket, idempotency_key: Optional[str] = Header(default=None)):
     db = SessionLocal()
     try:
+        existing = find_existing(db, payload.channel, payload.source_ref, idempotency_key)
+        if existing:
+            return duplicate_response(existing)
+
         cls = safe_classify(payload.subject + "\n" + payload.body)
-        route = route_ticket(cls["category"], payload.urgency, cls.get("confidence"))
+        with span("route"):
+            route = route_ticket(cls["category"], payload.urgency, cls.get("confidence"))
         route = apply_historical_prior(db, cls["category"], route, cls.get("confidence"))
 
-        ticket = Ticket(
-            created_at=datetime.utcnow(),
-            source=payload.channel,
-            source_ref=payload.source_ref,
-            user_email=payload.user_email,
-            user_phone=payload.user_phone,
-            subject=payload.subject,
-            body=payload.body,
-            category=cls["category"],
-            priority=route["priority"],
-            status="open",
-            assignee_team=route["team"],
-            assignee_user=None
-        )
-        db.add(ticket)
-        db.commit()
-        db.refresh(ticket)
-
-        if AUTO_ASSIGN:
-            assignee = choose_assignee(ticket.assignee_team, ticket.id)
-            if assignee:
-                ticket.assignee_user = assignee
-                db.commit()
-                db.refresh(ticket)
-
         try:
-            notify_ticket_created(ticket)
-            notify_requester_ticket_created(ticket)
-            notify_assignment(ticket)
-            notify_user_assignment(ticket)
-            notify_requester_assigned(ticket)
-        except Exception as e:
-            print("Notification error:", e)
+            ticket, queued = run_write(db, lambda wdb: insert_ticket(wdb, payload, cls, route, idempotency_key))
+        except IntegrityError:
+            # A concurrent request with the same key/source_ref won the insert
+            db.rollback()
+            existing = find_existing(db, payload.channel, payload.source_ref, idempotency_key)
+            if existing:
+                return duplicate_response(existing)
+            raise
+        routing_prior.add(ticket.category, ticket.assignee_team, ticket.priority)
+        ticket_stats.add(stats_key(ticket), ticket.created_at)
+        response_cache.invalidate(HEAD_PAGES)
+        event_hub.publish("ticket_created", ticket.to_dict())
+        send_notifications(ticket, CREATED_EVENTS, queued=queued)
 
         suggestions = []
         if kb_engine and not KB_DISABLED:
             try:
-                suggestions = kb_engine.suggest(db, f"{payload.subject} {payload.body}", top_k=3)
+                with span("kb_suggest"):
+                    suggestions = kb_engine.suggest(db, f"{payload.subject} {payload.body}", top_k=3)
             except Exception as e:
                 print("KB suggestion error:", e)
+                metrics.errors.inc("kb_suggest")
 
         return {
             "ticket": ticket.to_dict(),
@@ -242,52 +490,440 @@ def ingest_ticket(payload: IngestTicket):
     finally:
         db.close()
 
+def ingest_chunk(items: List[IngestTicket], notify: bool = True, retry: bool = True) -> List[Dict]:
+    # One classify_many call, one INSERT ... RETURNING and one outbox insert
+    # per chunk, all committed in a single transaction
+    db = SessionLocal()
+    try:
+        # Items whose (channel, source_ref) is already stored, or repeated
+        # earlier in the chunk, resolve to that ticket without side effects
+        refs = {(p.channel, p.source_ref) for p in items if p.source_ref}
+        known = {}
+        if refs:
+            q = db.query(Ticket.id, Ticket.source, Ticket.source_ref).filter(Ticket.source_ref.in_({r for _, r in refs}))
+            for tid, source, ref in q:
+                if (source, ref) in refs:
+                    known[(source, ref)] = tid
+        fresh, seen = [], set()
+        for i, p in enumerate(items):
+            key = (p.channel, p.source_ref)
+            if p.source_ref and (key in known or key in seen):
+                continue
+            seen.add(key)
+            fresh.append(i)
+
+        texts = [items[i].subject + "\n" + items[i].body for i in fresh]
+        try:
+            with span("classify_batch"):
+                classes = classify_many(texts)
+        except Exception as e:
+            print("Classification error:", e)
+            metrics.errors.inc("classify")
+            classes = [safe_classify(t) for t in texts]
+
+        now = datetime.utcnow()
+        rows = []
+        for i, cls in zip(fresh, classes):
+            p = items[i]
+            with span("route"):
+                route = route_ticket(cls["category"], p.urgency, cls.get("confidence"))
+            route = apply_historical_prior(db, cls["category"], route, cls.get("confidence"))
+            rows.append({
+                "created_at": now,
+                "source": p.channel,
+                "source_ref": p.source_ref,
+                "user_email": p.user_email,
+                "user_phone": p.user_phone,
+                "subject": p.subject,
+                "body": p.body,
+                "category": cls["category"],
+                "priority": route["priority"],
+                "status": "open",
+                "assignee_team": route["team"],
+                "assignee_user": None,
+            })
+        queued = bool(notify and rows and outbox and outbox.NOTIFY_ASYNC)
+
+        def write(wdb):
+            if not rows:
+                return []
+            ids = wdb.scalars(insert(Ticket).returning(Ticket.id, sort_by_parameter_order=True), rows).all()
+            if AUTO_ASSIGN:
+                with span("auto_assign"):
+                    for row, tid in zip(rows, ids):
+                        row["assignee_user"] = choose_assignee(row["assignee_team"], tid)
+                assigned = [{"id": tid, "assignee_user": row["assignee_user"]} for row, tid in zip(rows, ids) if row["assignee_user"]]
+                if assigned:
+                    wdb.execute(update(Ticket), assigned)
+            if queued:
+                outbox.enqueue_many(wdb, ids, CREATED_EVENTS)
+            return ids
+
+        ids = run_write(db, write)
+
+        for row in rows:
+            routing_prior.add(row["category"], row["assignee_team"], row["priority"])
+            ticket_stats.add((row["status"], row["category"], row["assignee_team"], row["priority"]), row["created_at"])
+        if rows:
+            response_cache.invalidate(HEAD_PAGES)
+            for row, tid in zip(rows, ids):
+                event_hub.publish("ticket_created", {**row, "id": tid, "created_at": row["created_at"].isoformat()})
+        if queued:
+            outbox.worker.wake()
+        elif notify and ids:
+            for t in db.query(Ticket).filter(Ticket.id.in_(ids)).order_by(Ticket.id):
+                send_notifications(t, CREATED_EVENTS)
+
+        results = [None] * len(items)
+        for i, row, tid, cls in zip(fresh, rows, ids, classes):
+            results[i] = {
+                "ok": True,
+                "id": tid,
+                "category": row["category"],
+                "confidence": cls.get("confidence"),
+                "team": row["assignee_team"],
+                "priority": row["priority"],
+                "assignee_user": row["assignee_user"],
+            }
+            if row["source_ref"]:
+                known.setdefault((row["source"], row["source_ref"]), tid)
+        for i, p in enumerate(items):
+            if results[i] is None:
+                results[i] = {"ok": True, "duplicate": True, "id": known[(p.channel, p.source_ref)]}
+        return results
+    except IntegrityError as e:
+        db.rollback()
+        if retry:
+            # Lost a race with another ingest of the same source_ref; the
+            # second pass sees those rows as duplicates
+            return ingest_chunk(items, notify, retry=False)
+        print("Bulk ingest error:", e)
+        return [{"ok": False, "error": str(e)} for _ in items]
+    except Exception as e:
+        db.rollback()
+        print("Bulk ingest error:", e)
+        return [{"ok": False, "error": str(e)} for _ in items]
+    finally:
+        db.close()
+
+async def bulk_records(request: Request):
+    # A JSON array is parsed whole; anything else is read as NDJSON and
+    # yielded line by line while the body is still streaming in
+    parts, buf, array = [], b"", None
+    async for chunk in request.stream():
+        if array is None:
+            head = (buf + chunk).lstrip()
+            if not head:
+                continue
+            array = head[:1] == b"["
+        if array:
+            parts.append(chunk)
+            continue
+        *lines, buf = (buf + chunk).split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if array:
+        try:
+            data = json.loads(b"".join(parts))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON array: {e}")
+        if not isinstance(data, list):
+            raise HTTPException(status_code=400, detail="Expected a JSON array or NDJSON")
+        for obj in data:
+            yield obj
+    elif buf.strip():
+        yield buf
+
+@app.post("/tickets/ingest/bulk")
+async def ingest_bulk(request: Request, notify: bool = True):
+    start = time.perf_counter()
+    results, batch, slots = [], [], []
+
+    async def flush():
+        for slot, r in zip(slots, await run_in_threadpool(ingest_chunk, list(batch), notify)):
+            results[slot].update(r)
+        batch.clear()
+        slots.clear()
+
+    async for record in bulk_records(request):
+        index = len(results)
+        try:
+            obj = json.loads(record) if isinstance(record, bytes) else record
+            if not isinstance(obj, dict):
+                raise ValueError("expected a JSON object")
+            payload = IngestTicket(**obj)
+        except (ValueError, ValidationError) as e:
+            results.append({"index": index, "ok": False, "error": str(e)})
+            continue
+        results.append({"index": index})
+        batch.append(payload)
+        slots.append(index)
+        if len(batch) >= BULK_CHUNK_SIZE:
+            await flush()
+    if batch:
+        await flush()
+
+    seconds = time.perf_counter() - start
+    created = sum(1 for r in results if r.get("ok") and not r.get("duplicate"))
+    duplicates = sum(1 for r in results if r.get("duplicate"))
+    return {
+        "received": len(results),
+        "created": created,
+        "duplicates": duplicates,
+        "failed": len(results) - created - duplicates,
+        "seconds": round(seconds, 3),
+        "tickets_per_second": round(created / seconds, 1) if seconds > 0 else None,
+        "results": results,
+    }
+
+TICKET_FIELDS = [c.name for c in Ticket.__table__.columns if c.name != "idempotency_key"]
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    if not fields:
+        return TICKET_FIELDS
+    names = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in names if f not in TICKET_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return names
+
+def ticket_select(names: List[str], status=None, team=None, priority=None, category=None):
+    # Plain column tuples (no ORM objects), newest first; created_at and id
+    # are always selected because they form the keyset cursor
+    columns = Ticket.__table__.c
+    stmt = select(*[columns[n] for n in dict.fromkeys(names + ["created_at", "id"])])
+    for column, value in (
+        (Ticket.status, status),
+        (Ticket.assignee_team, team),
+        (Ticket.priority, priority),
+        (Ticket.category, category),
+    ):
+        if value:
+            stmt = stmt.where(column == value)
+    return stmt.order_by(Ticket.created_at.desc(), Ticket.id.desc())
+
+def row_dict(row, names: List[str]) -> Dict:
+    m = row._mapping
+    out = {n: m[n] for n in names}
+    if out.get("created_at"):
+        out["created_at"] = out["created_at"].isoformat()
+    return out
+
+def encode_cursor(row) -> Optional[str]:
+    m = row._mapping
+    if m["created_at"] is None:
+        return None
+    return base64.urlsafe_b64encode(f"{m['created_at'].isoformat()}|{m['id']}".encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, tid = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(tid)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# Cache tags: pages without a cursor shift on every insert; ticket:<id> marks
+# each page a ticket is on; <dim>:<value> marks pages filtered on that value
+HEAD_PAGES = "tickets:head"
+FILTER_DIMS = ("status", "category", "team", "priority")
+
+def cache_key(request: Request) -> str:
+    return request.url.path + "?" + request.url.query
+
+def entry_response(request: Request, entry) -> Response:
+    body, etag, headers = entry
+    # no-cache: browsers keep the body but revalidate with If-None-Match
+    headers = {"ETag": etag, "Cache-Control": "no-cache", **headers}
+    sent = [t.strip().removeprefix("W/") for t in request.headers.get("if-none-match", "").split(",")]
+    if etag in sent or "*" in sent:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+def cached_response(request: Request) -> Optional[Response]:
+    # A hit is answered from stored bytes (or a 304) without touching the DB
+    entry = response_cache.get(cache_key(request))
+    return entry_response(request, entry) if entry else None
+
+def store_response(request: Request, content, tags: List[str], generation: int, headers: Optional[Dict] = None) -> Response:
+    body = JSONResponse(content).body
+    entry = (body, make_etag(body), headers or {})
+    response_cache.put(cache_key(request), entry, tags, generation)
+    return entry_response(request, entry)
+
+def list_tags(rows, cursor: Optional[str], **filters) -> List[str]:
+    tags = [f"ticket:{r._mapping['id']}" for r in rows]
+    tags += [f"{dim}:{value}" for dim, value in filters.items() if value]
+    if not cursor:
+        tags.append(HEAD_PAGES)
+    return tags
+
 @app.get("/tickets")
-def list_tickets(limit: int = 50, offset: int = 0, status: Optional[str] = None):
+def list_tickets(
+    request: Request,
+    limit: int = 50,
+    offset: int = 0,
+    status: Optional[str] = None,
+    team: Optional[str] = None,
+    priority: Optional[str] = None,
+    category: Optional[str] = None,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+):
+    # Pass the X-Next-Cursor response header back as ?cursor= for the next
+    # page; unlike offset it costs the same however deep the page is
+    hit = cached_response(request)
+    if hit:
+        return hit
+    generation = response_cache.generation
+    names = parse_fields(fields)
+    stmt = ticket_select(names, status, team, priority, category)
+    if cursor:
+        created_at, tid = decode_cursor(cursor)
+        stmt = stmt.where(or_(
+            Ticket.created_at < created_at,
+            and_(Ticket.created_at == created_at, Ticket.id < tid),
+        ))
+    elif offset:
+        stmt = stmt.offset(offset)
     db = SessionLocal()
     try:
-        q = db.query(Ticket)
-        if status:
-            q = q.filter(Ticket.status == status)
-        q = q.order_by(Ticket.created_at.desc()).offset(offset).limit(limit)
-        return [t.to_dict() for t in q.all()]
+        rows = db.execute(stmt.limit(limit)).all()
     finally:
         db.close()
+    headers = {}
+    if rows and len(rows) == limit:
+        next_cursor = encode_cursor(rows[-1])
+        if next_cursor:
+            headers["X-Next-Cursor"] = next_cursor
+    tags = list_tags(rows, cursor, status=status, category=category, team=team, priority=priority)
+    return store_response(request, [row_dict(r, names) for r in rows], tags, generation, headers)
+
+@app.get("/tickets/export")
+def export_tickets(
+    fmt: str = Query(default="ndjson", alias="format"),
+    status: Optional[str] = None,
+    team: Optional[str] = None,
+    priority: Optional[str] = None,
+    category: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    if fmt not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    names = parse_fields(fields)
+    # yield_per streams from a server-side cursor, so memory stays flat
+    stmt = ticket_select(names, status, team, priority, category).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+    def stream():
+        db = SessionLocal()
+        try:
+            result = db.execute(stmt)
+            if fmt == "csv":
+                buf = io.StringIO()
+                writer = csv.writer(buf)
+                writer.writerow(names)
+                for part in result.partitions():
+                    writer.writerows([row_dict(r, names)[n] for n in names] for r in part)
+                    yield buf.getvalue()
+                    buf.seek(0)
+                    buf.truncate()
+                if buf.tell():
+                    yield buf.getvalue()
+            else:
+                for part in result.partitions():
+                    yield "".join(json.dumps(row_dict(r, names)) + "\n" for r in part)
+        finally:
+            db.close()
+
+    media_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        stream(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="tickets.{fmt}"'},
+    )
+
+@app.get("/tickets/stream")
+async def stream_tickets(
+    request: Request,
+    team: Optional[str] = None,
+    last_event_id: Optional[str] = Query(default=None),
+    last_event_header: Optional[str] = Header(default=None, alias="Last-Event-ID"),
+):
+    # Server-sent events: ticket_created / ticket_updated / ticket_assigned,
+    # optionally only for ?team=A,B. EventSource reconnects with the
+    # Last-Event-ID header and gets what it missed from recent history.
+    teams = {t.strip() for t in team.split(",") if t.strip()} if team else None
+    return StreamingResponse(
+        event_hub.stream(request, teams, last_event_header or last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.get("/tickets/{ticket_id}")
-def get_ticket(ticket_id: int):
+def get_ticket(ticket_id: int, request: Request):
+    hit = cached_response(request)
+    if hit:
+        return hit
+    generation = response_cache.generation
     db = SessionLocal()
     try:
-        t = db.query(Ticket).filter(Ticket.id == ticket_id).first()
+        t = db.get(Ticket, ticket_id)
         if not t:
             raise HTTPException(status_code=404, detail="Ticket not found")
-        return t.to_dict()
+        return store_response(request, t.to_dict(), [f"ticket:{t.id}"], generation)
     finally:
         db.close()
 
+# PATCHes to the same ticket take turns (per process), so each one reads the
+# state the previous one committed and the counters move from exactly that
+UPDATE_LOCK_STRIPES = 64
+update_locks = [threading.Lock() for _ in range(UPDATE_LOCK_STRIPES)]
+
+def stats_key(t: Ticket):
+    return (t.status, t.category, t.assignee_team, t.priority)
+
+def track_update(before, after, t: Ticket, assigned: bool = False):
+    # before/after are stats_key() as the update read and wrote the row; t
+    # itself may be reloaded with a later PATCH's values once committed
+    routing_prior.move(before[1:], after[1:])
+    ticket_stats.move(before, after)
+    # Pages showing this ticket, plus filtered pages it may have just entered
+    changed = [f"{dim}:{new}" for dim, old, new in zip(FILTER_DIMS, before, after) if new != old and new]
+    response_cache.invalidate(f"ticket:{t.id}", *changed)
+    # The previous team hears about a ticket moving away from it too
+    kind = "ticket_assigned" if assigned or before[2] != after[2] else "ticket_updated"
+    event_hub.publish(kind, t.to_dict(), teams=[before[2]])
+
+def apply_ticket_update(db, ticket_id: int, payload: UpdateTicket):
+    # Row lock on Postgres/MySQL; SQLite relies on update_locks
+    t = db.get(Ticket, ticket_id, with_for_update=True)
+    if not t:
+        return None
+    before = stats_key(t)
+    if payload.status:
+        t.status = payload.status
+    if payload.assignee_team:
+        t.assignee_team = payload.assignee_team
+    if payload.assignee_user is not None:
+        t.assignee_user = payload.assignee_user
+    if payload.priority:
+        t.priority = payload.priority
+    notify = payload.assignee_user is not None and bool(t.assignee_user)
+    queued = notify and queue_notifications(db, t, ASSIGNED_EVENTS)
+    return t, before, stats_key(t), notify, queued
+
 @app.patch("/tickets/{ticket_id}")
 def update_ticket(ticket_id: int, payload: UpdateTicket):
     db = SessionLocal()
     try:
-        t = db.query(Ticket).filter(Ticket.id == ticket_id).first()
-        if not t:
+        with update_locks[ticket_id % UPDATE_LOCK_STRIPES]:
+            result = run_write(db, lambda wdb: apply_ticket_update(wdb, ticket_id, payload))
+        if not result:
             raise HTTPException(status_code=404, detail="Ticket not found")
-        if payload.status:
-            t.status = payload.status
-        if payload.assignee_team:
-            t.assignee_team = payload.assignee_team
-        if payload.assignee_user is not None:
-            t.assignee_user = payload.assignee_user
-        if payload.priority:
-            t.priority = payload.priority
-        db.commit()
-        db.refresh(t)
-        try:
-            if payload.assignee_user is not None and t.assignee_user:
-                notify_user_assignment(t)
-                notify_requester_assigned(t)
-        except Exception as e:
-            print("Notification error update:", e)
+        t, before, after, notify, queued = result
+        track_update(before, after, t, assigned=notify)
+        if notify:
+            send_notifications(t, ASSIGNED_EVENTS, queued=queued)
         return t.to_dict()
     finally:
         db.close()
@@ -299,42 +935,177 @@ def contact_requester(ticket_id: int, message: str = Body(..., embed=True)):
         t = db.query(Ticket).filter(Ticket.id == ticket_id).first()
         if not t:
             raise HTTPException(status_code=404, detail="Ticket not found")
-        try:
-            notify_contact_requester(t, message)
-        except Exception as e:
-            print("Contact requester notification error:", e)
+        queued = run_write(db, lambda wdb: queue_notifications(wdb, t, ["contact_requester"], message))
+        send_notifications(t, ["contact_requester"], message, queued=queued)
         return {"ok": True}
     finally:
         db.close()
 
+def chat_ticket(payload: IngestTicket, key: str, state: Dict):
+    try:
+        result = ingest_ticket(payload, idempotency_key=key)
+        state.setdefault("tickets", []).append(result["ticket"]["id"])
+        chat_tickets.put(key, {"status": "created", "ticket_id": result["ticket"]["id"], "error": None})
+    except Exception as e:
+        print("Chat ticket error:", e)
+        chat_tickets.put(key, {"status": "failed", "ticket_id": None, "error": str(e)})
+
+def chat_ingest_done(_future):
+    global chat_ingest_pending
+    with chat_ingest_lock:
+        chat_ingest_pending -= 1
+
+def submit_chat_ticket(payload: IngestTicket, key: str, state: Dict):
+    global chat_ingest_pending
+    with chat_ingest_lock:
+        chat_ingest_pending += 1
+    try:
+        future = chat_ingest.submit(chat_ticket, payload, key, state)
+    except Exception:
+        chat_ingest_done(None)
+        raise
+    future.add_done_callback(chat_ingest_done)
+
 @app.post("/chat")
-def chat(payload: ChatMessage):
-    text = (payload.message or "").lower().strip()
-    def resp(message: str, resolved: bool=False, intent: Optional[str]=None, create_ticket: bool=False):
-        return {"response": message, "resolved": resolved, "intent": intent, "create_ticket": create_ticket}
-
-    if any(k in text for k in ["password","reset","forgot"]) and "vpn" not in text:
-        return resp("Reset password: Ctrl+Alt+Del -> Change password (VPN first if remote). 'create ticket' to escalate.", True, "password_reset")
-    if "vpn" in text:
-        return resp("VPN: Install client, AD creds, approve MFA. 'create ticket' to escalate.", True, "vpn_help")
-    if any(k in text for k in ["outlook","email","o365"]):
-        return resp("Outlook: Add Account -> Microsoft 365. Restart if prompted. 'create ticket' to escalate.", True, "outlook_config")
-    if "printer" in text or "print" in text:
-        return resp("Printer: Check power/network; reinstall driver; IP printing if discovery fails. 'create ticket' to escalate.", True, "printer_issue")
-
-    if "create ticket" in text or "open ticket" in text:
+def chat(payload: ChatMessage, idempotency_key: Optional[str] = Header(default=None)):
+    session_id = payload.session_id or uuid.uuid4().hex
+    state = chat_sessions.get(session_id)
+    state["turn"] += 1
+    reply = chat_engine.reply(payload.message or "")
+
+    if reply.get("action") == "create_ticket":
+        # Only a client-supplied id makes a resend return the same ticket; a
+        # session counter would repeat after the session expires or a restart
+        key = f"chat:{idempotency_key or payload.message_id or uuid.uuid4().hex}"
+        known = chat_tickets.get(key)
+        if known and known["status"] != "failed":
+            return {"response": "Ticket request received; it will show up in your tickets shortly.", "resolved": True,
+                    "intent": "create_ticket", "create_ticket": True, "ticket_ref": key, "ticket_status": known["status"],
+                    "session_id": session_id}
+        # The ticket carries what the user said earlier in the session and is
+        # created in the background; GET /chat/tickets/{ref} reports how it went
+        history = state["history"] + [payload.message]
         fake = IngestTicket(
-            subject="Chatbot-created ticket",
-            body=payload.message,
+            subject=f"Chatbot: {history[0][:80]}" if len(history) > 1 else "Chatbot-created ticket",
+            body="\n".join(history),
             user_email=payload.user_email or "unknown@local",
             user_phone=payload.user_phone,
             channel="chatbot"
         )
-        result = ingest_ticket(fake)
-        return {"response":"Ticket created from chat.", "resolved":True, "intent":"create_ticket",
-                "ticket":result["ticket"], "kb_suggestions":result["kb_suggestions"]}
+        chat_tickets.put(key, {"status": "pending", "ticket_id": None, "error": None})
+        submit_chat_ticket(fake, key, state)
+        state["history"] = []
+        return {"response": "Ticket request received; it will show up in your tickets shortly.", "resolved": True,
+                "intent": "create_ticket", "create_ticket": True, "ticket_ref": key, "ticket_status": "pending",
+                "session_id": session_id}
+
+    state["history"] = (state["history"] + [payload.message])[-CHAT_HISTORY:]
+    return {**reply, "create_ticket": False, "session_id": session_id}
+
+@app.get("/chat/tickets/{ref}")
+def chat_ticket_status(ref: str):
+    known = chat_tickets.get(ref)
+    if known is None:
+        raise HTTPException(status_code=404, detail="Unknown ticket_ref")
+    return {"ticket_ref": ref, **known}
+
+def kb_hook(method: str, *args):
+    chat_engine.invalidate()
+    if kb_engine and not KB_DISABLED:
+        try:
+            getattr(kb_engine, method)(*args)
+        except Exception as e:
+            print("KB index update error:", e)
+
+@app.get("/kb")
+def list_kb():
+    db = SessionLocal()
+    try:
+        return [a.to_dict() for a in db.query(KnowledgeBase).order_by(KnowledgeBase.id).all()]
+    finally:
+        db.close()
+
+@app.post("/kb/index")
+def index_kb(articles: List[KBArticle]):
+    db = SessionLocal()
+    try:
+        rows = [KnowledgeBase(title=a.title, content=a.content, tags=",".join(a.tags)) for a in articles]
+
+        def write(wdb):
+            wdb.add_all(rows)
+            wdb.flush()
+            return rows
+
+        rows = run_write(db, write)
+        for r in rows:
+            kb_hook("add", r.id, r.title, r.content)
+        return [r.to_dict() for r in rows]
+    finally:
+        db.close()
 
-    return resp("I can help with password, VPN, Outlook, printer. Describe your issue or say 'create ticket'.")
+@app.post("/kb/suggest")
+def suggest_kb(payload: KBSuggestRequest):
+    texts = ([payload.text] if payload.text is not None else []) + payload.texts
+    if not texts:
+        raise HTTPException(status_code=422, detail="Provide text or texts")
+    if not kb_engine or KB_DISABLED:
+        return {"results": [[] for _ in texts]}
+    db = SessionLocal()
+    try:
+        return {"results": kb_engine.suggest_many(db, texts, top_k=payload.top_k)}
+    finally:
+        db.close()
+
+@app.put("/kb/{kb_id}")
+def update_kb(kb_id: int, payload: UpdateKBArticle):
+    def write(wdb):
+        a = wdb.get(KnowledgeBase, kb_id)
+        if a:
+            if payload.title is not None:
+                a.title = payload.title
+            if payload.content is not None:
+                a.content = payload.content
+            if payload.tags is not None:
+                a.tags = ",".join(payload.tags)
+        return a
+
+    db = SessionLocal()
+    try:
+        a = run_write(db, write)
+        if not a:
+            raise HTTPException(status_code=404, detail="Article not found")
+        kb_hook("update", a.id, a.title, a.content)
+        return a.to_dict()
+    finally:
+        db.close()
+
+@app.delete("/kb/{kb_id}")
+def delete_kb(kb_id: int):
+    def write(wdb):
+        a = wdb.get(KnowledgeBase, kb_id)
+        if a:
+            wdb.delete(a)
+        return a is not None
+
+    db = SessionLocal()
+    try:
+        if not run_write(db, write):
+            raise HTTPException(status_code=404, detail="Article not found")
+        kb_hook("delete", kb_id)
+        return {"ok": True}
+    finally:
+        db.close()
+
+@app.get("/stats")
+def stats():
+    # Dashboard counters, served from memory (see ticket_stats.py)
+    if not ticket_stats.built:
+        db = SessionLocal()
+        try:
+            ticket_stats.build(db)
+        finally:
+            db.close()
+    return {**ticket_stats.snapshot(), "generated_at": datetime.utcnow().isoformat()}
 
 @app.get("/db-test")
 def db_test():
@@ -344,4 +1115,14 @@ def db_test():
         db.close()
         return {"ok": True, "tickets": count}
     except Exception as e:
-        return {"ok": False, "error": str(e)}
\ No newline at end of file
+        return {"ok": False, "error": str(e)}
+
+if AsyncSessionLocal is not None:
+    from .async_api import router as async_router
+    # Swap the async handlers in where the sync ones were registered, so
+    # route order (/tickets/export before /tickets/{ticket_id}) still holds
+    for route in async_router.routes:
+        for i, r in enumerate(app.router.routes):
+            if getattr(r, "path", None) == route.path and getattr(r, "methods", None) == route.methods:
+                app.router.routes[i] = route
+                break
@@ -0,0 +1,153 @@
+import os
+import time
+import bisect
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Hot-path timings and counters for GET /metrics (Prometheus text format).
+# Recording is a perf_counter pair plus a bucket increment under a lock, so it
+# stays on in production; METRICS_ENABLED=false turns the spans into no-ops.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Histogram bucket upper bounds, in seconds
+METRICS_BUCKETS = tuple(sorted(float(b) for b in os.getenv(
+    "METRICS_BUCKETS", "0.0005,0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10"
+).split(",") if b.strip()))
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class Histogram:
+    # One series per value of a single label (stage, channel, ...)
+    def __init__(self, name: str, help: str, label: str, buckets: Tuple[float, ...] = METRICS_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series: Dict[str, list] = {}  # value -> [bucket counts..., sum, count]
+
+    def observe(self, value: str, seconds: float):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            s = self._series.get(value)
+            if s is None:
+                s = self._series[value] = [0] * len(self.buckets) + [0.0, 0]
+            if i < len(self.buckets):
+                s[i] += 1
+            s[-2] += seconds
+            s[-1] += 1
+
+    def render(self, out: List[str]):
+        out.append(f"# HELP {self.name} {self.help}")
+        out.append(f"# TYPE {self.name} histogram")
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for value, s in sorted(series.items()):
+            lv = f'{self.label}="{_escape(value)}"'
+            cumulative = 0
+            for bound, n in zip(self.buckets, s):
+                cumulative += n
+                out.append(f'{self.name}_bucket{{{lv},le="{_fmt(bound)}"}} {cumulative}')
+            out.append(f'{self.name}_bucket{{{lv},le="+Inf"}} {s[-1]}')
+            out.append(f"{self.name}_sum{{{lv}}} {_fmt(s[-2])}")
+            out.append(f"{self.name}_count{{{lv}}} {s[-1]}")
+
+class Counter:
+    def __init__(self, name: str, help: str, label: str):
+        self.name = name
+        self.help = help
+        self.label = label
+        self._lock = threading.Lock()
+        self._values: Dict[str, int] = {}
+
+    def inc(self, value: str, n: int = 1):
+        with self._lock:
+            self._values[value] = self._values.get(value, 0) + n
+
+    def render(self, out: List[str]):
+        out.append(f"# HELP {self.name} {self.help}")
+        out.append(f"# TYPE {self.name} counter")
+        with self._lock:
+            values = dict(self._values)
+        for value, n in sorted(values.items()):
+            out.append(f'{self.name}{{{self.label}="{_escape(value)}"}} {n}')
+
+class Gauge:
+    # Read at scrape time: fn returns a number, or {label value: number}
+    # when `label` is set. None (e.g. the component is disabled) is skipped.
+    # kind="counter" for totals that another component already keeps.
+    def __init__(self, name: str, help: str, fn: Callable, label: Optional[str] = None, kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.label = label
+        self.kind = kind
+
+    def render(self, out: List[str]):
+        try:
+            value = self.fn()
+        except Exception as e:
+            print(f"Metrics gauge {self.name} error:", e)
+            return
+        if value is None:
+            return
+        out.append(f"# HELP {self.name} {self.help}")
+        out.append(f"# TYPE {self.name} {self.kind}")
+        if self.label:
+            for k, v in sorted(value.items()):
+                out.append(f'{self.name}{{{self.label}="{_escape(k)}"}} {_fmt(v)}')
+        else:
+            out.append(f"{self.name} {_fmt(value)}")
+
+class Span:
+    __slots__ = ("histogram", "value", "start")
+
+    def __init__(self, histogram: Histogram, value: str):
+        self.histogram = histogram
+        self.value = value
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(self.value, time.perf_counter() - self.start)
+        return False
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NO_SPAN = _NoSpan()
+
+stage_seconds = Histogram("helpdesk_stage_seconds", "Time spent in each ticket ingest stage", "stage")
+notify_seconds = Histogram("helpdesk_notify_send_seconds", "Time spent sending one notification, by channel", "channel")
+notify_failures = Counter("helpdesk_notify_failures_total", "Notification sends that failed, by channel", "channel")
+errors = Counter("helpdesk_errors_total", "Errors caught and logged on the ingest path, by stage", "stage")
+
+_metrics: List = [stage_seconds, notify_seconds, notify_failures, errors]
+
+def span(stage: str):
+    return Span(stage_seconds, stage) if METRICS_ENABLED else _NO_SPAN
+
+def send_span(channel: str):
+    return Span(notify_seconds, channel) if METRICS_ENABLED else _NO_SPAN
+
+def gauge(name: str, help: str, fn: Callable, label: Optional[str] = None, kind: str = "gauge"):
+    _metrics.append(Gauge(name, help, fn, label, kind))
+
+def render() -> str:
+    out: List[str] = []
+    for metric in _metrics:
+        metric.render(out)
+    return "\n".join(out) + "\n"
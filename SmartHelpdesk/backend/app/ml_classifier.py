@@ -0,0 +1,86 @@
+import os
+import threading
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import joblib
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+
+ARTIFACT_FORMAT = 1
+
+class MLClassifier:
+    # TF-IDF + logistic regression over ticket text, fitted offline on
+    # historical Ticket.category labels (see tools/train_classifier.py)
+    def __init__(self, pipeline: Pipeline, version: str, n_samples: int = 0):
+        self.pipeline = pipeline
+        self.version = version
+        self.n_samples = n_samples
+
+    @property
+    def classes(self) -> List[str]:
+        return list(self.pipeline.classes_)
+
+    @classmethod
+    def train(cls, texts: List[str], labels: List[str]) -> "MLClassifier":
+        pipeline = Pipeline([
+            ("tfidf", TfidfVectorizer(stop_words="english", sublinear_tf=True, ngram_range=(1, 2), min_df=2)),
+            ("clf", LogisticRegression(max_iter=1000, class_weight="balanced")),
+        ])
+        pipeline.fit(texts, labels)
+        return cls(pipeline, datetime.utcnow().strftime("%Y%m%d%H%M%S"), len(texts))
+
+    def predict(self, texts: List[str]) -> List[Tuple[str, float]]:
+        # One vectorisation and one matrix product for the whole batch
+        proba = self.pipeline.predict_proba(texts)
+        best = proba.argmax(axis=1)
+        classes = self.pipeline.classes_
+        return [(str(classes[i]), float(p)) for i, p in zip(best, proba[np.arange(len(best)), best])]
+
+    def save(self, path: str):
+        artifact = {
+            "format": ARTIFACT_FORMAT,
+            "version": self.version,
+            "n_samples": self.n_samples,
+            "pipeline": self.pipeline,
+        }
+        tmp = f"{path}.tmp{os.getpid()}"
+        joblib.dump(artifact, tmp)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["MLClassifier"]:
+        artifact = joblib.load(path)
+        if not isinstance(artifact, dict) or artifact.get("format") != ARTIFACT_FORMAT:
+            print("Classifier model format mismatch; ignoring", path)
+            return None
+        return cls(artifact["pipeline"], artifact["version"], artifact.get("n_samples", 0))
+
+class ModelLoader:
+    # Loads the artifact on first use and again whenever the file changes,
+    # so a retrained model is picked up without a restart
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._model = None
+
+    def get(self) -> Optional[MLClassifier]:
+        if not self.path:
+            return None
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return None
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    try:
+                        self._model = MLClassifier.load(self.path)
+                    except Exception as e:
+                        print("Classifier model load failed:", e)
+                        self._model = None
+                    self._mtime = mtime
+        return self._model
@@ -1,17 +1,92 @@
 import os
 from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text
+from sqlalchemy import create_engine, event, inspect, make_url, Column, Integer, String, DateTime, Text, Index
 from sqlalchemy.orm import sessionmaker, declarative_base
 
+from .pooling import DB_PRE_PING, LivenessChecker, engine_options
+
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./helpdesk.db")
 
-# For Postgres/MySQL etc. we do not use connect_args
+# An async driver in DATABASE_URL (sqlite+aiosqlite://, postgresql+asyncpg://)
+# switches the ticket endpoints to AsyncSession. Startup, the outbox worker
+# and the tools keep a sync engine on the matching sync driver
+# (SYNC_DATABASE_URL overrides the derived URL).
+ASYNC_DRIVERS = {"aiosqlite": "pysqlite", "asyncpg": "psycopg2", "aiomysql": "pymysql", "asyncmy": "pymysql"}
+ASYNC_DATABASE_URL = None
+_url = make_url(DATABASE_URL)
+_backend, _, _driver = _url.drivername.partition("+")
+if _driver in ASYNC_DRIVERS:
+    ASYNC_DATABASE_URL = DATABASE_URL
+    DATABASE_URL = os.getenv("SYNC_DATABASE_URL") or _url.set(
+        drivername=f"{_backend}+{ASYNC_DRIVERS[_driver]}"
+    ).render_as_string(hide_password=False)
+
+# SQLITE_PROFILE=production: WAL (readers no longer block the writer),
+# relaxed fsync, bigger page cache and mmap on every connection; main.py
+# then also funnels API writes through one group-committing writer thread
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "default").lower()
+SQLITE_PRODUCTION = DATABASE_URL.startswith("sqlite") and SQLITE_PROFILE == "production"
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    # negative = KiB, so 64 MiB of page cache per connection
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "temp_store": "MEMORY",
+}
+
+def _apply_sqlite_pragmas(dbapi_connection):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+# For Postgres/MySQL etc. we do not use connect_args; pool sizing, pre-ping
+# and statement caching come from the DB_* settings in pooling.py
 if DATABASE_URL.startswith("sqlite"):
     engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 else:
-    engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+    engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+# Started by the app when DB_PRE_PING=false
+liveness = None if DATABASE_URL.startswith("sqlite") or DB_PRE_PING else LivenessChecker(engine)
+
+if SQLITE_PRODUCTION:
+    @event.listens_for(engine, "connect")
+    def _on_sqlite_connect(dbapi_connection, connection_record):
+        _apply_sqlite_pragmas(dbapi_connection)
+        # SQLAlchemy emits BEGIN itself (below) so SAVEPOINTs behave; the
+        # writer relies on them to isolate one failed ticket in a batch
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _on_sqlite_begin(conn):
+        # Connections that always write (the writer thread) take the write
+        # lock up front; a deferred BEGIN that reads first can fail to upgrade
+        conn.exec_driver_sql(conn.get_execution_options().get("sqlite_begin", "BEGIN"))
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+async_engine = None
+AsyncSessionLocal = None
+if ASYNC_DATABASE_URL:
+    try:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+        if ASYNC_DATABASE_URL.startswith("sqlite"):
+            async_engine = create_async_engine(ASYNC_DATABASE_URL)
+        else:
+            async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL, is_async=True))
+        AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+        if SQLITE_PRODUCTION and ASYNC_DATABASE_URL.startswith("sqlite"):
+            event.listen(async_engine.sync_engine, "connect", lambda c, r: _apply_sqlite_pragmas(c))
+    except Exception as e:
+        print("Async engine unavailable, using sync sessions:", e)
+
+async def get_async_db():
+    # FastAPI dependency: one AsyncSession per request, closed afterwards
+    async with AsyncSessionLocal() as db:
+        yield db
+
 Base = declarative_base()
 
 class Ticket(Base):
@@ -29,6 +104,15 @@ class Ticket(Base):
     status = Column(String(20), default="open", index=True)
     assignee_team = Column(String(100), index=True)
     assignee_user = Column(String(100))
+    idempotency_key = Column(String(200))
+
+    # Re-ingesting the same upstream item (or replaying a request with the same
+    # Idempotency-Key) finds the existing ticket instead of creating another;
+    # NULLs are not compared, so tickets without a source_ref are unaffected
+    __table_args__ = (
+        Index("ux_tickets_source_ref", "source", "source_ref", unique=True),
+        Index("ux_tickets_idempotency_key", "idempotency_key", unique=True),
+    )
 
     def to_dict(self):
         return {
@@ -62,18 +146,52 @@ class KnowledgeBase(Base):
             "tags": (self.tags or "").split(",")
         }
 
-def _ensure_sqlite_migrations():
-    if not DATABASE_URL.startswith("sqlite"):
-        return
+class NotificationOutbox(Base):
+    __tablename__ = "notification_outbox"
+    id = Column(Integer, primary_key=True, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    event = Column(String(50))
+    ticket_id = Column(Integer, index=True)
+    message = Column(Text)
+    status = Column(String(20), default="pending", index=True)
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, index=True)
+    last_error = Column(Text)
+
+    # Claims look up due pending rows; the retention prune finds old sent/failed ones
+    __table_args__ = (
+        Index("ix_outbox_status_next_attempt", "status", "next_attempt_at"),
+        Index("ix_outbox_status_created", "status", "created_at"),
+    )
+
+# Columns added to tickets after the first release; create_all() never alters
+# an existing table, on any backend
+ADDED_TICKET_COLUMNS = ("user_phone", "idempotency_key")
+
+def _ensure_columns():
     try:
-        with engine.connect() as conn:
-            rows = conn.exec_driver_sql("PRAGMA table_info(tickets)").fetchall()
-            cols = [r[1] for r in rows]
-            if "user_phone" not in cols:
-                conn.exec_driver_sql("ALTER TABLE tickets ADD COLUMN user_phone VARCHAR(30)")
+        existing = {c["name"] for c in inspect(engine).get_columns("tickets")}
+        missing = [name for name in ADDED_TICKET_COLUMNS if name not in existing]
+        if not missing:
+            return
+        with engine.begin() as conn:
+            for name in missing:
+                column_type = Ticket.__table__.c[name].type.compile(dialect=engine.dialect)
+                conn.exec_driver_sql(f"ALTER TABLE tickets ADD COLUMN {name} {column_type}")
+                print(f"Migration: added tickets.{name}")
     except Exception as e:
-        print("SQLite migration warning:", e)
+        print("Schema migration warning:", e)
+
+def _ensure_indexes():
+    # create_all() skips indexes on tables that already exist
+    for index in (*Ticket.__table__.indexes, *NotificationOutbox.__table__.indexes):
+        try:
+            index.create(bind=engine, checkfirst=True)
+        except Exception as e:
+            # e.g. duplicates already stored; lookups still work, just unenforced
+            print(f"Index {index.name} not created:", e)
 
 def init_db():
     Base.metadata.create_all(bind=engine)
-    _ensure_sqlite_migrations()
\ No newline at end of file
+    _ensure_columns()
+    _ensure_indexes()
\ No newline at end of file
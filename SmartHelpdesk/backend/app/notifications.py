@@ -1,8 +1,10 @@
 import os
+import time
 import smtplib
+import threading
 from email.mime.text import MIMEText
-import requests
 from .models import Ticket
+from .metrics import notify_failures, send_span
 
 # Email config (optional; logs to console if not set)
 SMTP_HOST = os.getenv("SMTP_HOST")
@@ -11,6 +13,17 @@ SMTP_USER = os.getenv("SMTP_USER")
 SMTP_PASS = os.getenv("SMTP_PASS")
 ALERT_TO = os.getenv("ALERT_TO", "")
 ALERT_FROM = os.getenv("ALERT_FROM", SMTP_USER or "noreply@localhost")
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "2"))
+SMTP_IDLE_SECONDS = float(os.getenv("SMTP_IDLE_SECONDS", "60"))
+SMTP_CHECK_SECONDS = float(os.getenv("SMTP_CHECK_SECONDS", "15"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))
+
+# Digest coalescing (DIGEST_WINDOW_SECONDS=0 disables): messages per channel and
+# recipient are buffered until DIGEST_WINDOW_SECONDS pass without a new one, or
+# DIGEST_MAX_SECONDS after the first, then sent as a single digest.
+DIGEST_WINDOW_SECONDS = float(os.getenv("DIGEST_WINDOW_SECONDS", "0"))
+DIGEST_MAX_SECONDS = float(os.getenv("DIGEST_MAX_SECONDS", "60"))
+DIGEST_IMMEDIATE_PRIORITIES = {p.strip().upper() for p in os.getenv("DIGEST_IMMEDIATE_PRIORITIES", "P1").split(",") if p.strip()}
 
 # Webhooks (optional)
 DISCORD_WEBHOOK_URL = os.getenv("DISCORD_WEBHOOK_URL")
@@ -44,68 +57,334 @@ def _enabled(event: str) -> bool:
 def _console(subject: str, body: str):
     print(f"[ALERT] {subject}\n{body}\n")
 
-def _smtp_send(to_addr: str, subject: str, body: str):
+# Send failures are still logged and swallowed; the outbox worker collects them
+# per event (thread-local) to decide whether to retry. The outbox id being
+# delivered travels the same way, so a digest can report back for its row.
+_delivery = threading.local()
+
+def _failed(channel: str, err):
+    notify_failures.inc(channel)
+    failures = getattr(_delivery, "failures", None)
+    if failures is not None:
+        failures.append(f"{channel}: {err}")
+
+def capture_failures(fn, *args, outbox_id=None):
+    _delivery.failures = []
+    _delivery.outbox_id = outbox_id
+    try:
+        fn(*args)
+        return _delivery.failures
+    finally:
+        _delivery.failures = None
+        _delivery.outbox_id = None
+
+# Reuses authenticated SMTP connections instead of a handshake per message.
+# Connections idle longer than SMTP_IDLE_SECONDS are reopened; ones idle longer
+# than SMTP_CHECK_SECONDS get a NOOP health check before reuse.
+class SMTPPool:
+    def __init__(self, size: int = SMTP_POOL_SIZE, idle_seconds: float = SMTP_IDLE_SECONDS,
+                 check_seconds: float = SMTP_CHECK_SECONDS):
+        self.idle_seconds = idle_seconds
+        self.check_seconds = check_seconds
+        self._slots = threading.BoundedSemaphore(max(1, size))
+        self._lock = threading.Lock()
+        self._idle = []  # (server, last_used)
+
+    def _connect(self):
+        server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=10)
+        try:
+            server.starttls()
+            if SMTP_USER and SMTP_PASS:
+                server.login(SMTP_USER, SMTP_PASS)
+        except Exception:
+            pass
+        return server
+
+    def _close(self, server):
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def _healthy(self, server) -> bool:
+        try:
+            return server.noop()[0] == 250
+        except Exception:
+            return False
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                server, last_used = self._idle.pop()
+            idle = time.monotonic() - last_used
+            if idle > self.idle_seconds or (idle > self.check_seconds and not self._healthy(server)):
+                self._close(server)
+                continue
+            return server
+        return self._connect()
+
+    def _checkin(self, server):
+        with self._lock:
+            self._idle.append((server, time.monotonic()))
+
+    @staticmethod
+    def _dropped(e: Exception) -> bool:
+        # SMTPException subclasses OSError; only a lost connection counts here,
+        # not a server reply such as 550 or refused recipients
+        return isinstance(e, smtplib.SMTPServerDisconnected) or (
+            isinstance(e, OSError) and not isinstance(e, smtplib.SMTPException))
+
+    def send(self, msg):
+        with self._slots:
+            server = self._checkout()
+            try:
+                try:
+                    server.send_message(msg)
+                except Exception as e:
+                    if not self._dropped(e):
+                        raise
+                    # Server dropped a pooled connection; retry once on a fresh one
+                    self._close(server)
+                    server = None
+                    server = self._connect()
+                    server.send_message(msg)
+            except Exception as e:
+                # A rejected message leaves the connection usable (smtplib
+                # resets the transaction), so it goes back to the pool
+                if server is not None:
+                    if self._dropped(e):
+                        self._close(server)
+                    else:
+                        self._checkin(server)
+                raise
+            self._checkin(server)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for server, _ in idle:
+            self._close(server)
+
+smtp_pool = SMTPPool()
+
+_transport_lock = threading.Lock()
+_http = None
+_twilio = None
+
+def _http_session():
+    # Shared keep-alive session for Discord/Telegram webhooks
+    global _http
+    with _transport_lock:
+        if _http is None:
+            import requests  # lazy import
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _http = session
+        return _http
+
+def _twilio_client():
+    global _twilio
+    with _transport_lock:
+        if _twilio is None:
+            from twilio.rest import Client  # lazy import
+            _twilio = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+        return _twilio
+
+class Coalescer:
+    def __init__(self, window: float = DIGEST_WINDOW_SECONDS, max_latency: float = DIGEST_MAX_SECONDS):
+        self.window = window
+        self.max_latency = max(window, max_latency)
+        self._cond = threading.Condition()
+        self._buf = {}  # (channel, recipient) -> {"first", "last", "items": [(subject, body, (id, team), outbox_id)]}
+        self._thread = None
+        # Set by the outbox worker: on_hold(outbox_id) when one of its alerts is
+        # buffered, on_release(outbox_id, failures) once that digest was sent
+        self.on_hold = None
+        self.on_release = None
+
+    def offer(self, channel: str, recipient: str, subject, body: str, ticket=None) -> bool:
+        # False means the caller should send right away
+        if self.window <= 0 or ticket is None:
+            return False
+        if (ticket.priority or "").upper() in DIGEST_IMMEDIATE_PRIORITIES:
+            return False
+        oid = getattr(_delivery, "outbox_id", None)
+        if oid is not None and self.on_hold:
+            self.on_hold(oid)
+        now = time.monotonic()
+        with self._cond:
+            entry = self._buf.setdefault((channel, recipient), {"first": now, "last": now, "items": []})
+            entry["last"] = now
+            entry["items"].append((subject, body, (ticket.id, ticket.assignee_team), oid))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="notify-digest", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return True
+
+    def _take_due(self, now: float):
+        due, wait = [], None
+        for key, entry in list(self._buf.items()):
+            deadline = min(entry["last"] + self.window, entry["first"] + self.max_latency)
+            if deadline <= now:
+                due.append((key, self._buf.pop(key)["items"]))
+            else:
+                wait = deadline - now if wait is None else min(wait, deadline - now)
+        return due, wait
+
+    def _run(self):
+        while True:
+            with self._cond:
+                due, wait = self._take_due(time.monotonic())
+                while not due:
+                    self._cond.wait(wait)
+                    due, wait = self._take_due(time.monotonic())
+            for key, items in due:
+                self._flush(key, items)
+
+    def _flush(self, key, items):
+        channel, recipient = key
+        try:
+            subject, body = digest(channel, items)
+            failures = capture_failures(_DIRECT[channel], recipient, subject, body)
+        except Exception as e:
+            _console(f"DIGEST SEND FAILED ({channel})", f"TO={recipient}\nError: {e}")
+            failures = [f"{channel}: {e}"]
+        if self.on_release:
+            for item in items:
+                if item[3] is not None:
+                    self.on_release(item[3], failures)
+
+    def flush_all(self):
+        with self._cond:
+            pending, self._buf = self._buf, {}
+        for key, entry in pending.items():
+            self._flush(key, entry["items"])
+
+def digest(channel: str, items):
+    if len(items) == 1:
+        return items[0][0], items[0][1]
+    ids, teams = [], {}
+    for _, _, (ticket_id, team), _ in items:
+        if ticket_id not in ids:
+            ids.append(ticket_id)
+            teams[team or "unassigned"] = teams.get(team or "unassigned", 0) + 1
+    per_team = ", ".join(f"{n} {team}" for team, n in sorted(teams.items(), key=lambda kv: -kv[1]))
+    refs = ", ".join(f"#{i}" for i in ids[:20]) + (", …" if len(ids) > 20 else "")
+    head = f"{len(ids)} tickets ({per_team}), {len(items)} updates: {refs}"
+    if channel == "email":
+        parts = [f"{s}\n{b}" if s else b for s, b, _, _ in items]
+        return f"[Helpdesk] Digest: {head}", "\n\n---\n\n".join(parts)
+    lines = [b for _, b, _, _ in items[:10]]
+    if len(items) > 10:
+        lines.append(f"… and {len(items) - 10} more")
+    text = head + "\n" + "\n".join(lines)
+    if channel == "sms":
+        text = text[:1600]  # Twilio's max message body
+    return None, text
+
+coalescer = Coalescer()
+
+def close_transports():
+    global _http, _twilio
+    coalescer.flush_all()
+    smtp_pool.close()
+    with _transport_lock:
+        if _http is not None:
+            _http.close()
+        _http = None
+        _twilio = None
+
+def _smtp_send(to_addr: str, subject: str, body: str, ticket=None):
     if not SMTP_HOST or not SMTP_PORT or not to_addr:
         _console(subject, f"TO={to_addr}\n{body}")
         return
+    if coalescer.offer("email", to_addr, subject, body, ticket):
+        return
     try:
         msg = MIMEText(body)
         msg["Subject"] = subject
         msg["From"] = ALERT_FROM
         msg["To"] = to_addr
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=10) as server:
-            try:
-                server.starttls()
-                if SMTP_USER and SMTP_PASS:
-                    server.login(SMTP_USER, SMTP_PASS)
-            except Exception:
-                pass
-            server.send_message(msg)
+        with send_span("email"):
+            smtp_pool.send(msg)
     except Exception as e:
         _console(f"EMAIL SEND FAILED: {subject}", f"TO={to_addr}\n{body}\nError: {e}")
+        _failed("email", e)
 
-def _send_email(subject: str, body: str):
+def _send_email(subject: str, body: str, ticket=None):
     if ALERT_TO:
-        _smtp_send(ALERT_TO, subject, body)
+        _smtp_send(ALERT_TO, subject, body, ticket)
     else:
         _console(subject, body)
 
-def _send_email_to(to_addr: str, subject: str, body: str):
+def _send_email_to(to_addr: str, subject: str, body: str, ticket=None):
     if to_addr:
-        _smtp_send(to_addr, subject, body)
+        _smtp_send(to_addr, subject, body, ticket)
 
-def _send_discord(body: str):
+def _send_discord(body: str, ticket=None):
     if not DISCORD_WEBHOOK_URL:
         return
+    if coalescer.offer("discord", "", None, body, ticket):
+        return
     try:
-        requests.post(DISCORD_WEBHOOK_URL, json={"content": body}, timeout=10)
+        with send_span("discord"):
+            r = _http_session().post(DISCORD_WEBHOOK_URL, json={"content": body}, timeout=10)
+        r.raise_for_status()
     except Exception as e:
         _console("DISCORD SEND FAILED", f"{body}\nError: {e}")
+        _failed("discord", e)
 
-def _send_telegram(body: str):
+def _send_telegram(body: str, ticket=None):
     if not (TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID):
         return
+    if coalescer.offer("telegram", "", None, body, ticket):
+        return
     try:
         url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-        requests.post(url, json={"chat_id": TELEGRAM_CHAT_ID, "text": body}, timeout=10)
+        with send_span("telegram"):
+            r = _http_session().post(url, json={"chat_id": TELEGRAM_CHAT_ID, "text": body}, timeout=10)
+        r.raise_for_status()
     except Exception as e:
         _console("TELEGRAM SEND FAILED", f"{body}\nError: {e}")
+        _failed("telegram", e)
 
-def _send_sms_to_list(numbers, body: str):
+def _send_sms_to_list(numbers, body: str, ticket=None):
     if not numbers:
         return
     if not (TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN and TWILIO_FROM):
         return
+    numbers = [to for to in numbers if not coalescer.offer("sms", to, None, body, ticket)]
+    if not numbers:
+        return
     try:
-        from twilio.rest import Client  # lazy import
-        client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+        client = _twilio_client()
         for to in numbers:
             try:
-                client.messages.create(from_=TWILIO_FROM, to=to, body=body)
+                with send_span("sms"):
+                    client.messages.create(from_=TWILIO_FROM, to=to, body=body)
             except Exception as e:
                 _console("SMS SEND FAILED (one recipient)", f"TO={to}\n{body}\nError: {e}")
+                _failed("sms", e)
     except Exception as e:
         _console("SMS INIT FAILED", f"{body}\nError: {e}")
+        _failed("sms", e)
+
+# Used by the digest flusher; these never coalesce again (no ticket passed)
+_DIRECT = {
+    "email": lambda to, subject, body: _smtp_send(to, subject, body),
+    "discord": lambda _to, _subject, body: _send_discord(body),
+    "telegram": lambda _to, _subject, body: _send_telegram(body),
+    "sms": lambda to, _subject, body: _send_sms_to_list([to], body),
+}
 
 def _assignee_phone(email: str) -> str:
     if not email:
@@ -117,10 +396,10 @@ def notify_ticket_created(ticket: Ticket):
         return
     subject = f"[Helpdesk] New ticket #{ticket.id} ({ticket.priority}) - {ticket.subject}"
     body = f"Category: {ticket.category}\nTeam: {ticket.assignee_team}\nUser: {ticket.user_email or ''} / {ticket.user_phone or ''}\n\n{ticket.body}"
-    _send_email(subject, body)
-    _send_discord(f"New ticket #{ticket.id} → {ticket.assignee_team} [{ticket.priority}] — {ticket.subject}")
-    _send_telegram(f"New ticket #{ticket.id} → {ticket.assignee_team} [{ticket.priority}] — {ticket.subject}")
-    _send_sms_to_list(TWILIO_TO, f"New ticket #{ticket.id}: {ticket.assignee_team} [{ticket.priority}] — {ticket.subject}")
+    _send_email(subject, body, ticket)
+    _send_discord(f"New ticket #{ticket.id} → {ticket.assignee_team} [{ticket.priority}] — {ticket.subject}", ticket)
+    _send_telegram(f"New ticket #{ticket.id} → {ticket.assignee_team} [{ticket.priority}] — {ticket.subject}", ticket)
+    _send_sms_to_list(TWILIO_TO, f"New ticket #{ticket.id}: {ticket.assignee_team} [{ticket.priority}] — {ticket.subject}", ticket)
 
 def notify_requester_ticket_created(ticket: Ticket):
     if not ALERT_USER_ON_CREATE or not ticket.user_email:
@@ -131,28 +410,28 @@ def notify_requester_ticket_created(ticket: Ticket):
         f"ID: {ticket.id}\nCategory: {ticket.category}\nTeam: {ticket.assignee_team}\nPriority: {ticket.priority}\n\n"
         f"Details:\n{ticket.body}\n\nWe will keep you updated.\n"
     )
-    _send_email_to(ticket.user_email, subject, body)
+    _send_email_to(ticket.user_email, subject, body, ticket)
 
 def notify_assignment(ticket: Ticket):
     if not _enabled("assignment"):
         return
     subject = f"[Helpdesk] Assigned to {ticket.assignee_team} - Ticket #{ticket.id}"
     body = f"Ticket #{ticket.id} assigned to team {ticket.assignee_team} with priority {ticket.priority}."
-    _send_email(subject, body)
-    _send_discord(f"Assigned: ticket #{ticket.id} → {ticket.assignee_team} [{ticket.priority}]")
-    _send_telegram(f"Assigned: ticket #{ticket.id} → {ticket.assignee_team} [{ticket.priority}]")
-    _send_sms_to_list(TWILIO_TO, f"Assigned: ticket #{ticket.id} → {ticket.assignee_team} [{ticket.priority}]")
+    _send_email(subject, body, ticket)
+    _send_discord(f"Assigned: ticket #{ticket.id} → {ticket.assignee_team} [{ticket.priority}]", ticket)
+    _send_telegram(f"Assigned: ticket #{ticket.id} → {ticket.assignee_team} [{ticket.priority}]", ticket)
+    _send_sms_to_list(TWILIO_TO, f"Assigned: ticket #{ticket.id} → {ticket.assignee_team} [{ticket.priority}]", ticket)
 
 def notify_user_assignment(ticket: Ticket):
     if not ALERT_USER_ON_ASSIGNMENT or not ticket.assignee_user:
         return
     subject = f"[Helpdesk] You are assigned — Ticket #{ticket.id}"
     body = f"You have been assigned ticket #{ticket.id} [{ticket.priority}] ({ticket.category}):\n{ticket.subject}\n\n{ticket.body}\nRequester: {ticket.user_email or ''} / {ticket.user_phone or ''}"
-    _send_email_to(ticket.assignee_user, subject, body)
+    _send_email_to(ticket.assignee_user, subject, body, ticket)
     # SMS direct to assignee if mapping present
     phone = _assignee_phone(ticket.assignee_user)
     if phone:
-        _send_sms_to_list([phone], f"You are assigned: #{ticket.id} [{ticket.priority}] — {ticket.subject}. Requester: {ticket.user_phone or ticket.user_email or ''}")
+        _send_sms_to_list([phone], f"You are assigned: #{ticket.id} [{ticket.priority}] — {ticket.subject}. Requester: {ticket.user_phone or ticket.user_email or ''}", ticket)
 
 def notify_requester_assigned(ticket: Ticket):
     # Inform requester who will contact them
@@ -162,10 +441,10 @@ def notify_requester_assigned(ticket: Ticket):
     subject = f"[Helpdesk] Your ticket #{ticket.id} is assigned"
     body = f"Your ticket #{ticket.id} is assigned to {ticket.assignee_team} ({contact}). They will contact you shortly."
     if ticket.user_email:
-        _send_email_to(ticket.user_email, subject, body)
+        _send_email_to(ticket.user_email, subject, body, ticket)
     # SMS to requester if phone present
     if ticket.user_phone:
-        _send_sms_to_list([ticket.user_phone], f"Ticket #{ticket.id} assigned to {ticket.assignee_team}. Contact: {contact}")
+        _send_sms_to_list([ticket.user_phone], f"Ticket #{ticket.id} assigned to {ticket.assignee_team}. Contact: {contact}", ticket)
 
 def notify_contact_requester(ticket: Ticket, message: str):
     # Agent-triggered: reach out to requester via email + SMS (if phone present)
@@ -173,4 +452,14 @@ def notify_contact_requester(ticket: Ticket, message: str):
     if ticket.user_email:
         _send_email_to(ticket.user_email, subject, message)
     if ticket.user_phone:
-        _send_sms_to_list([ticket.user_phone], f"Ticket #{ticket.id}: {message}")
\ No newline at end of file
+        _send_sms_to_list([ticket.user_phone], f"Ticket #{ticket.id}: {message}")
+
+# Event name -> handler, used by the outbox worker and the inline fallback
+NOTIFIERS = {
+    "ticket_created": notify_ticket_created,
+    "requester_ticket_created": notify_requester_ticket_created,
+    "assignment": notify_assignment,
+    "user_assignment": notify_user_assignment,
+    "requester_assigned": notify_requester_assigned,
+    "contact_requester": notify_contact_requester,
+}
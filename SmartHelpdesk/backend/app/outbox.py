@@ -0,0 +1,278 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+
+from sqlalchemy import delete, insert
+
+from .models import SessionLocal, Ticket, NotificationOutbox
+from .notifications import NOTIFIERS, capture_failures, coalescer
+
+# Outbox delivery (set NOTIFY_ASYNC=false to send inline inside the request)
+NOTIFY_ASYNC = os.getenv("NOTIFY_ASYNC", "true").lower() == "true"
+NOTIFY_WORKERS = int(os.getenv("NOTIFY_WORKERS", "4"))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "5"))
+NOTIFY_BACKOFF_SECONDS = float(os.getenv("NOTIFY_BACKOFF_SECONDS", "2"))
+NOTIFY_POLL_SECONDS = float(os.getenv("NOTIFY_POLL_SECONDS", "5"))
+# A claimed row is hidden from other workers/processes for this long; if the
+# process dies mid-send the row becomes due again afterwards.
+NOTIFY_LEASE_SECONDS = float(os.getenv("NOTIFY_LEASE_SECONDS", "60"))
+# Sent rows are deleted after NOTIFY_RETENTION_DAYS and failed ones after
+# NOTIFY_FAILED_RETENTION_DAYS (0 keeps them), checked every NOTIFY_PRUNE_SECONDS
+NOTIFY_RETENTION_DAYS = float(os.getenv("NOTIFY_RETENTION_DAYS", "7"))
+NOTIFY_FAILED_RETENTION_DAYS = float(os.getenv("NOTIFY_FAILED_RETENTION_DAYS", "30"))
+NOTIFY_PRUNE_SECONDS = float(os.getenv("NOTIFY_PRUNE_SECONDS", "3600"))
+PRUNE_BATCH = 1000
+
+def enqueue(db, ticket_id: int, events: Iterable[str], message: Optional[str] = None):
+    # Added to the caller's transaction so events commit together with the ticket
+    for event in events:
+        db.add(NotificationOutbox(event=event, ticket_id=ticket_id, message=message))
+
+def enqueue_many(db, ticket_ids: List[int], events: Iterable[str], message: Optional[str] = None):
+    # One executemany for a whole batch of tickets, same transaction semantics
+    rows = [{"event": e, "ticket_id": tid, "message": message} for tid in ticket_ids for e in events]
+    if rows:
+        db.execute(insert(NotificationOutbox), rows)
+
+def deliver(event: str, ticket: Ticket, message: Optional[str] = None):
+    handler = NOTIFIERS[event]
+    if message is not None:
+        handler(ticket, message)
+    else:
+        handler(ticket)
+
+def backoff(attempts: int) -> float:
+    return NOTIFY_BACKOFF_SECONDS * (2 ** max(0, attempts - 1))
+
+class OutboxWorker:
+    def __init__(self, workers: int = NOTIFY_WORKERS, poll_seconds: float = NOTIFY_POLL_SECONDS):
+        self.workers = max(1, workers)
+        self.poll_seconds = poll_seconds
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._inflight = set()
+        # Rows with alerts waiting in a digest buffer: id -> {"parts", "failures",
+        # "attempts" (set once delivery returned)}. They stay leased, not sent,
+        # until every part is flushed; if the process dies first the lease
+        # runs out and the row is delivered again.
+        self._held = {}
+        self._pool = None
+        self._thread = None
+        self._next_prune = 0.0
+        self.pruned = 0
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        coalescer.on_hold = self._hold
+        coalescer.on_release = self._release
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="notify")
+        self._thread = threading.Thread(target=self._run, name="notify-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._pool:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def wake(self):
+        self._wake.set()
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._inflight)
+
+    def prune(self) -> int:
+        # Deletes in small batches so a big backlog never holds the (SQLite)
+        # write lock for long
+        now = datetime.utcnow()
+        total = 0
+        for status, days in (("sent", NOTIFY_RETENTION_DAYS), ("failed", NOTIFY_FAILED_RETENTION_DAYS)):
+            if days <= 0:
+                continue
+            cutoff = now - timedelta(days=days)
+            while not self._stop.is_set():
+                db = SessionLocal()
+                try:
+                    ids = [oid for (oid,) in (
+                        db.query(NotificationOutbox.id)
+                        .filter(NotificationOutbox.status == status, NotificationOutbox.created_at < cutoff)
+                        .limit(PRUNE_BATCH)
+                        .all()
+                    )]
+                    db.commit()
+                    if ids:
+                        db.execute(delete(NotificationOutbox).where(NotificationOutbox.id.in_(ids)))
+                        db.commit()
+                finally:
+                    db.close()
+                total += len(ids)
+                if len(ids) < PRUNE_BATCH:
+                    break
+        self.pruned += total
+        return total
+
+    def _run(self):
+        while not self._stop.is_set():
+            if time.monotonic() >= self._next_prune:
+                self._next_prune = time.monotonic() + NOTIFY_PRUNE_SECONDS
+                try:
+                    self.prune()
+                except Exception as e:
+                    print("Outbox prune error:", e)
+            try:
+                claimed = self._claim()
+            except Exception as e:
+                print("Outbox poll error:", e)
+                claimed = 0
+            if not claimed:
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+
+    def _claim(self) -> int:
+        # Keep at most 2x workers rows in flight so the pool queue stays bounded
+        with self._lock:
+            free = self.workers * 2 - len(self._inflight)
+        if free <= 0:
+            return 0
+        now = datetime.utcnow()
+        claimed = []
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(NotificationOutbox.id)
+                .filter(NotificationOutbox.status == "pending", NotificationOutbox.next_attempt_at <= now)
+                .order_by(NotificationOutbox.id)
+                .limit(free)
+                .all()
+            )
+            # End the read first: each UPDATE re-checks the claim, and a write
+            # that starts its own transaction waits on a busy SQLite writer
+            # instead of failing to upgrade a stale read snapshot
+            db.commit()
+            lease = now + timedelta(seconds=NOTIFY_LEASE_SECONDS)
+            for (oid,) in rows:
+                n = (
+                    db.query(NotificationOutbox)
+                    .filter(
+                        NotificationOutbox.id == oid,
+                        NotificationOutbox.status == "pending",
+                        NotificationOutbox.next_attempt_at <= now,
+                    )
+                    .update(
+                        {
+                            NotificationOutbox.next_attempt_at: lease,
+                            NotificationOutbox.attempts: NotificationOutbox.attempts + 1,
+                        },
+                        synchronize_session=False,
+                    )
+                )
+                if n:
+                    claimed.append(oid)
+            db.commit()
+        finally:
+            db.close()
+        for oid in claimed:
+            with self._lock:
+                self._inflight.add(oid)
+            self._pool.submit(self._process, oid)
+        return len(claimed)
+
+    def _hold(self, oid: int):
+        with self._lock:
+            entry = self._held.setdefault(oid, {"parts": 0, "failures": [], "attempts": None})
+            entry["parts"] += 1
+
+    def _release(self, oid: int, failures: List[str]):
+        with self._lock:
+            entry = self._held.get(oid)
+            if entry is None:
+                return
+            entry["parts"] -= 1
+            entry["failures"] += failures
+            if entry["parts"] > 0 or entry["attempts"] is None:
+                return
+            del self._held[oid]
+        self._finish(oid, entry["attempts"], entry["failures"])
+
+    def _outcome(self, attempts: int, failures: List[str]):
+        # Retries resend the whole event, so delivery is at-least-once per channel
+        if not failures:
+            return {"status": "sent", "last_error": None}
+        if attempts >= NOTIFY_MAX_ATTEMPTS:
+            return {"status": "failed", "last_error": "; ".join(failures)}
+        return {
+            "next_attempt_at": datetime.utcnow() + timedelta(seconds=backoff(attempts or 1)),
+            "last_error": "; ".join(failures),
+        }
+
+    def _write(self, db, oid: int, values):
+        # Written in a fresh transaction, as in _claim
+        db.rollback()
+        db.query(NotificationOutbox).filter(NotificationOutbox.id == oid).update(values, synchronize_session=False)
+        db.commit()
+
+    def _finish(self, oid: int, attempts: int, failures: List[str]):
+        db = SessionLocal()
+        try:
+            self._write(db, oid, self._outcome(attempts, failures))
+        except Exception as e:
+            print("Outbox delivery error:", e)
+        finally:
+            db.close()
+
+    def _process(self, oid: int):
+        db = SessionLocal()
+        try:
+            row = db.get(NotificationOutbox, oid)
+            if row is None:
+                return
+            ticket = db.get(Ticket, row.ticket_id)
+            attempts = row.attempts or 0
+            if ticket is None or row.event not in NOTIFIERS:
+                values = {"status": "failed", "last_error": "ticket not found" if ticket is None else f"unknown event {row.event}"}
+            else:
+                try:
+                    failures = capture_failures(deliver, row.event, ticket, row.message, outbox_id=oid)
+                except Exception as e:
+                    failures = [str(e)]
+                with self._lock:
+                    held = oid in self._held
+                if held:
+                    # Some alerts sit in digest buffers: keep the row leased
+                    # until they are out, then the last flush finishes it
+                    lease = datetime.utcnow() + timedelta(seconds=coalescer.max_latency + NOTIFY_LEASE_SECONDS)
+                    self._write(db, oid, {"next_attempt_at": lease})
+                    with self._lock:
+                        entry = self._held[oid]
+                        entry["failures"] += failures
+                        entry["attempts"] = attempts
+                        if entry["parts"] > 0:
+                            return
+                        del self._held[oid]
+                    failures = entry["failures"]
+                values = self._outcome(attempts, failures)
+            self._write(db, oid, values)
+        except Exception as e:
+            print("Outbox delivery error:", e)
+            # Left to its claim lease; don't let its digests finish it later
+            with self._lock:
+                if oid in self._held and self._held[oid]["attempts"] is None:
+                    del self._held[oid]
+        finally:
+            db.close()
+            with self._lock:
+                self._inflight.discard(oid)
+            self._wake.set()
+
+worker = OutboxWorker()
@@ -0,0 +1,140 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+# Connection pool for Postgres/MySQL (SQLite keeps SQLAlchemy's defaults)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# true = ping on every checkout (an extra round trip each time); false = one
+# background SELECT 1 every DB_LIVENESS_SECONDS, dropping the pool on failure
+DB_PRE_PING = os.getenv("DB_PRE_PING", "true").lower() == "true"
+DB_LIVENESS_SECONDS = float(os.getenv("DB_LIVENESS_SECONDS", "30"))
+# SQLAlchemy's compiled-statement cache, and asyncpg's per-connection
+# server-side prepared statement cache
+DB_QUERY_CACHE_SIZE = int(os.getenv("DB_QUERY_CACHE_SIZE", "500"))
+DB_PREPARED_CACHE_SIZE = int(os.getenv("DB_PREPARED_CACHE_SIZE", "256"))
+
+class PoolStats:
+    # Checkout wait times over the last `window` checkouts, plus totals
+    def __init__(self, window: int = 2048):
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=window)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.liveness_failures = 0
+
+    def observe(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self._waits.append(seconds)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            stats = {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "liveness_failures": self.liveness_failures,
+                "wait_ms_avg": round(1000 * self.wait_total / self.checkouts, 3) if self.checkouts else 0.0,
+                "wait_ms_max": round(1000 * self.wait_max, 3),
+            }
+        for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+            stats[f"wait_ms_{name}"] = round(1000 * waits[min(len(waits) - 1, int(q * len(waits)))], 3) if waits else 0.0
+        return stats
+
+pool_stats = PoolStats()
+
+class _Metered:
+    # Times every checkout, including waits for a free slot and new connects
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            pool_stats.observe(time.perf_counter() - start, timed_out=True)
+            raise
+        pool_stats.observe(time.perf_counter() - start)
+        return conn
+
+class MeteredQueuePool(_Metered, QueuePool):
+    pass
+
+class MeteredAsyncQueuePool(_Metered, AsyncAdaptedQueuePool):
+    pass
+
+def engine_options(url: str, is_async: bool = False) -> Dict:
+    options = {
+        "poolclass": MeteredAsyncQueuePool if is_async else MeteredQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_PRE_PING,
+        "query_cache_size": DB_QUERY_CACHE_SIZE,
+    }
+    if "+asyncpg" in url:
+        options["connect_args"] = {"prepared_statement_cache_size": DB_PREPARED_CACHE_SIZE}
+    return options
+
+def pool_status(engine) -> Optional[Dict]:
+    pool = getattr(engine, "pool", None)
+    if not isinstance(pool, QueuePool):
+        return None
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "max_overflow": pool._max_overflow,
+    }
+
+class LivenessChecker:
+    # Replaces per-checkout pre-ping: if the server went away, the pool is
+    # disposed so the next checkouts open fresh connections
+    def __init__(self, engine, interval: float = DB_LIVENESS_SECONDS):
+        self.engine = engine
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="db-liveness", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(5)
+            self._thread = None
+
+    def check(self) -> bool:
+        try:
+            with self.engine.connect() as conn:
+                conn.exec_driver_sql("SELECT 1")
+            return True
+        except Exception as e:
+            print("DB liveness check failed; disposing pool:", e)
+            pool_stats.liveness_failures += 1
+            self.engine.dispose()
+            return False
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.check()
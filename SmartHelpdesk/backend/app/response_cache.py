@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+# Cached GET /tickets and /tickets/{id} responses. Entries are dropped by tag
+# when ingest/PATCH touch them, and after RESPONSE_CACHE_TTL seconds at most
+# (0 disables caching; ETags are still sent). RESPONSE_CACHE_BACKEND=sqlite
+# shares one cache file between the workers on a host.
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "30"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1000"))
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory").lower()
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "./response_cache.sqlite3")
+
+# body, etag, extra headers
+Entry = Tuple[bytes, str, Dict[str, str]]
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+class MemoryBackend:
+    def __init__(self, size: int):
+        self.size = size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires, entry, tags)
+        self._tags: Dict[str, set] = {}
+
+    def get(self, key: str) -> Optional[Entry]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            if item[0] < time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return item[1]
+
+    def put(self, key: str, entry: Entry, tags: Iterable[str], ttl: float):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            tags = set(tags)
+            self._entries[key] = (time.monotonic() + ttl, entry, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.size:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, tags: Iterable[str]):
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._drop(key)
+
+    def _drop(self, key: str):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+class SqliteBackend:
+    # One file for all workers on the host: an invalidation by any worker is
+    # seen by the others. Eviction drops the entries written longest ago.
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, body BLOB, etag TEXT, headers TEXT, expires REAL, stored REAL);
+            CREATE INDEX IF NOT EXISTS ix_entries_stored ON entries (stored);
+            CREATE TABLE IF NOT EXISTS tags (tag TEXT, key TEXT, PRIMARY KEY (tag, key)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS ix_tags_key ON tags (key);
+        """)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Entry]:
+        row = self._conn().execute(
+            "SELECT body, etag, headers FROM entries WHERE key = ? AND expires > ?", (key, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        return bytes(row[0]), row[1], json.loads(row[2])
+
+    def put(self, key: str, entry: Entry, tags: Iterable[str], ttl: float):
+        body, etag, headers = entry
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM tags WHERE key = ?", (key,))
+            conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                (key, body, etag, json.dumps(headers), now + ttl, now),
+            )
+            conn.executemany("INSERT OR IGNORE INTO tags VALUES (?, ?)", [(t, key) for t in set(tags)])
+            excess = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - self.size
+            if excess > 0:
+                old = conn.execute("SELECT key FROM entries ORDER BY stored LIMIT ?", (excess,)).fetchall()
+                self._delete(conn, [k for (k,) in old])
+
+    def invalidate(self, tags: Iterable[str]):
+        tags = list(tags)
+        if not tags:
+            return
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            marks = ",".join("?" * len(tags))
+            keys = [k for (k,) in conn.execute(f"SELECT DISTINCT key FROM tags WHERE tag IN ({marks})", tags)]
+            self._delete(conn, keys)
+
+    def _delete(self, conn, keys):
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            conn.execute(f"DELETE FROM entries WHERE key IN ({marks})", chunk)
+            conn.execute(f"DELETE FROM tags WHERE key IN ({marks})", chunk)
+
+class ResponseCache:
+    def __init__(self, ttl: float = RESPONSE_CACHE_TTL, size: int = RESPONSE_CACHE_SIZE, backend: str = RESPONSE_CACHE_BACKEND):
+        self.ttl = ttl
+        self.backend = None
+        self.hits = 0
+        self.misses = 0
+        # Bumped by every invalidation; a response read from the database
+        # before a write is not stored after that write's invalidation
+        self.generation = 0
+        if ttl > 0 and size > 0:
+            try:
+                if backend == "sqlite":
+                    self.backend = SqliteBackend(RESPONSE_CACHE_PATH, size)
+                else:
+                    self.backend = MemoryBackend(size)
+            except Exception as e:
+                print("Response cache disabled:", e)
+
+    def get(self, key: str) -> Optional[Entry]:
+        if not self.backend:
+            return None
+        try:
+            entry = self.backend.get(key)
+        except Exception as e:
+            print("Response cache read error:", e)
+            entry = None
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def put(self, key: str, entry: Entry, tags: Iterable[str], generation: int):
+        if self.backend and generation == self.generation:
+            try:
+                self.backend.put(key, entry, tags, self.ttl)
+            except Exception as e:
+                print("Response cache write error:", e)
+
+    def invalidate(self, *tags: str):
+        self.generation += 1
+        if self.backend:
+            try:
+                self.backend.invalidate(tags)
+            except Exception as e:
+                print("Response cache invalidate error:", e)
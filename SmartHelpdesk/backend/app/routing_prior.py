@@ -0,0 +1,68 @@
+import threading
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import func
+
+from .models import Ticket
+
+Key = Tuple[str, Optional[str]]
+
+class RoutingPrior:
+    # category -> Counter of (assignee_team, priority) over tickets that have a
+    # team: the same groups apply_historical_prior used to GROUP BY per ingest.
+    # Built once from the table, then kept current by the ingest/PATCH paths.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Counter] = {}
+        self._best: Dict[str, Optional[Key]] = {}
+        self.built = False
+
+    def build(self, db):
+        counts = {}
+        rows = (
+            db.query(Ticket.category, Ticket.assignee_team, Ticket.priority, func.count())
+            .filter(Ticket.category != None, Ticket.assignee_team != None)
+            .group_by(Ticket.category, Ticket.assignee_team, Ticket.priority)
+        )
+        for category, team, priority, c in rows:
+            counts.setdefault(category, Counter())[(team, priority)] = c
+        with self._lock:
+            self._counts = counts
+            self._best = {}
+            self.built = True
+
+    def _bump(self, category: Optional[str], team: Optional[str], priority: Optional[str], n: int):
+        if category is None or team is None:
+            return
+        c = self._counts.setdefault(category, Counter())
+        c[(team, priority)] += n
+        # Only exact zeros are dropped; a negative count exposes drift
+        if c[(team, priority)] == 0:
+            del c[(team, priority)]
+        self._best.pop(category, None)
+
+    def add(self, category: Optional[str], team: Optional[str], priority: Optional[str]):
+        with self._lock:
+            self._bump(category, team, priority, 1)
+
+    def move(self, old: Tuple, new: Tuple):
+        # old/new are (category, team, priority) before and after an update
+        if old == new:
+            return
+        with self._lock:
+            self._bump(*old, -1)
+            self._bump(*new, 1)
+
+    def best(self, category: str) -> Optional[Key]:
+        # Highest count wins; ties go to the smallest (team, priority), the
+        # order SQLite emits groups in, with NULL priority first
+        with self._lock:
+            if category in self._best:
+                return self._best[category]
+            c = self._counts.get(category)
+            best = None
+            if c:
+                best = min(c.items(), key=lambda kv: (-kv[1], kv[0][0], kv[0][1] is not None, kv[0][1] or ""))[0]
+            self._best[category] = best
+            return best
@@ -0,0 +1,116 @@
+import os
+import json
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, Optional, Set
+
+# Recent events kept for clients resuming with Last-Event-ID, events a client
+# may fall behind by before it is disconnected, and the SSE keep-alive period
+EVENTS_HISTORY = int(os.getenv("EVENTS_HISTORY", "1000"))
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "256"))
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+
+SUMMARY_FIELDS = ("id", "created_at", "source", "subject", "category", "priority", "status", "assignee_team", "assignee_user")
+
+def summary(ticket: Dict) -> Dict:
+    return {k: ticket.get(k) for k in SUMMARY_FIELDS}
+
+class Subscriber:
+    def __init__(self, teams: Optional[Set[str]], loop, size: int):
+        self.teams = teams
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=size)
+        self.overflowed = False
+
+    def wants(self, teams: Iterable[Optional[str]]) -> bool:
+        return self.teams is None or any(t in self.teams for t in teams)
+
+    def offer(self, item):
+        # Runs on the subscriber's event loop
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # Too slow to keep up: end its stream rather than buffer without
+            # bound or block publishers; it resumes from its last event id
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+class EventHub:
+    # In-process pub/sub for ticket events. publish() is called from request
+    # threads and the event loop alike; each subscriber gets events through
+    # a bounded queue on its own loop. Ids are "<epoch>:<n>", so a resume
+    # against a restarted (or different) process is detected.
+    def __init__(self, history: int = EVENTS_HISTORY, queue_size: int = EVENTS_QUEUE_SIZE):
+        self.epoch = format(int(time.time() * 1000), "x")
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._history = deque(maxlen=history)
+        self._subs: Set[Subscriber] = set()
+        self.dropped = 0
+
+    def publish(self, kind: str, ticket: Dict, teams: Iterable[Optional[str]] = ()):
+        teams = set(teams) | {ticket.get("assignee_team")}
+        with self._lock:
+            self._seq += 1
+            event = (self._seq, teams, f"id: {self.epoch}:{self._seq}\nevent: {kind}\ndata: {json.dumps(summary(ticket))}\n\n")
+            self._history.append(event)
+            subs = [s for s in self._subs if s.wants(teams)]
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(sub.offer, event[2])
+            except RuntimeError:
+                # Its loop is gone
+                self.unsubscribe(sub)
+
+    def subscribe(self, teams: Optional[Set[str]], last_event_id: Optional[str]):
+        # Returns the subscriber and the missed events to send first; a reset
+        # event tells the client to reload because its gap can't be filled
+        sub = Subscriber(teams, asyncio.get_running_loop(), self.queue_size)
+        backlog = []
+        with self._lock:
+            if last_event_id:
+                epoch, _, seq = last_event_id.partition(":")
+                oldest = self._history[0][0] if self._history else self._seq + 1
+                if epoch != self.epoch or not seq.isdigit() or int(seq) + 1 < oldest:
+                    backlog.append(f"id: {self.epoch}:{self._seq}\nevent: reset\ndata: {{}}\n\n")
+                else:
+                    backlog += [text for n, t, text in self._history if n > int(seq) and sub.wants(t)]
+            self._subs.add(sub)
+        return sub, backlog
+
+    def unsubscribe(self, sub: Subscriber):
+        with self._lock:
+            if sub in self._subs:
+                self._subs.discard(sub)
+                if sub.overflowed:
+                    self.dropped += 1
+
+    def __len__(self):
+        return len(self._subs)
+
+    async def stream(self, request, teams: Optional[Set[str]], last_event_id: Optional[str]):
+        sub, backlog = self.subscribe(teams, last_event_id)
+        try:
+            yield "retry: 2000\n\n"
+            for text in backlog:
+                yield text
+            while True:
+                try:
+                    text = await asyncio.wait_for(sub.queue.get(), EVENTS_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                if text is None:
+                    break
+                yield text
+        finally:
+            self.unsubscribe(sub)
@@ -0,0 +1,91 @@
+import os
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import func
+
+from .models import Ticket
+
+# Window of the created-per-hour series, and the statuses that no longer
+# count towards a team's open backlog
+STATS_HOURS = int(os.getenv("STATS_HOURS", "48"))
+CLOSED_STATUSES = {s.strip() for s in os.getenv("STATS_CLOSED_STATUSES", "resolved,closed").split(",") if s.strip()}
+
+# (status, category, assignee_team, priority)
+Key = Tuple[Optional[str], Optional[str], Optional[str], Optional[str]]
+
+def hour_of(dt: datetime) -> datetime:
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+class TicketStats:
+    # Ticket counts per (status, category, team, priority) plus tickets created
+    # per hour, built once from the table and kept current by ingest/PATCH, so
+    # /stats never scans tickets. The dashboard breakdowns are sums over the
+    # combinations, of which there are only a few hundred at most.
+    def __init__(self, hours: int = STATS_HOURS):
+        self.hours = hours
+        self._lock = threading.Lock()
+        self._counts: Counter = Counter()
+        self._hourly: Counter = Counter()
+        self.built = False
+
+    def build(self, db):
+        counts = Counter()
+        rows = (
+            db.query(Ticket.status, Ticket.category, Ticket.assignee_team, Ticket.priority, func.count())
+            .group_by(Ticket.status, Ticket.category, Ticket.assignee_team, Ticket.priority)
+        )
+        for status, category, team, priority, c in rows:
+            counts[(status, category, team, priority)] = c
+        hourly = Counter()
+        since = hour_of(datetime.utcnow()) - timedelta(hours=self.hours - 1)
+        for (created_at,) in db.query(Ticket.created_at).filter(Ticket.created_at >= since).yield_per(1000):
+            hourly[hour_of(created_at)] += 1
+        with self._lock:
+            self._counts = counts
+            self._hourly = hourly
+            self.built = True
+
+    def add(self, key: Key, created_at: Optional[datetime] = None):
+        with self._lock:
+            self._counts[key] += 1
+            self._hourly[hour_of(created_at or datetime.utcnow())] += 1
+
+    def move(self, old: Key, new: Key):
+        if old == new:
+            return
+        with self._lock:
+            self._counts[old] -= 1
+            # A negative count means an update was tracked from a wrong
+            # before-state; leave it visible rather than drop it
+            if self._counts[old] == 0:
+                del self._counts[old]
+            self._counts[new] += 1
+
+    def snapshot(self) -> Dict:
+        now = hour_of(datetime.utcnow())
+        hours = [now - timedelta(hours=i) for i in range(self.hours - 1, -1, -1)]
+        by_status, by_category, by_team, by_priority, open_by_team = (Counter() for _ in range(5))
+        with self._lock:
+            for old in [h for h in self._hourly if h < hours[0]]:
+                del self._hourly[old]
+            series = [{"hour": h.isoformat(), "count": self._hourly.get(h, 0)} for h in hours]
+            combos = list(self._counts.items())
+        for (status, category, team, priority), c in combos:
+            by_status[status or "none"] += c
+            by_category[category or "none"] += c
+            by_team[team or "none"] += c
+            by_priority[priority or "none"] += c
+            if status not in CLOSED_STATUSES:
+                open_by_team[team or "none"] += c
+        return {
+            "total": sum(by_status.values()),
+            "by_status": dict(by_status),
+            "by_category": dict(by_category),
+            "by_team": dict(by_team),
+            "by_priority": dict(by_priority),
+            "open_by_team": dict(open_by_team),
+            "created_per_hour": series,
+        }
@@ -0,0 +1,132 @@
+import os
+import queue
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable
+
+from sqlalchemy.orm import Session
+
+# Group commit for the SQLite production profile: at most this many writes
+# share one transaction, and the writer waits this long for more to arrive
+WRITE_BATCH_MAX = int(os.getenv("SQLITE_WRITE_BATCH", "64"))
+WRITE_BATCH_WAIT_MS = float(os.getenv("SQLITE_WRITE_WAIT_MS", "2"))
+
+log = logging.getLogger(__name__)
+
+class WriteQueue:
+    # SQLite allows one writer at a time; rather than letting request threads
+    # fight over the lock (and fail with "database is locked"), they hand a
+    # write function to this single thread. Each function runs in its own
+    # SAVEPOINT, so one failure (e.g. a duplicate source_ref) rolls back only
+    # that write, and the batch is committed with a single fsync. The writer
+    # keeps its own connection so a full pool never starves it.
+    def __init__(self, engine, max_batch: int = WRITE_BATCH_MAX, wait_ms: float = WRITE_BATCH_WAIT_MS):
+        self.engine = engine
+        self.max_batch = max(1, max_batch)
+        self.wait = wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self.batches = 0
+        self.writes = 0
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, fn: Callable) -> Future:
+        # fn(db) runs on the writer thread; the future resolves after commit
+        # with its return value (ORM objects stay loaded, but detached)
+        fut = Future()
+        if not (self._thread and self._thread.is_alive()):
+            fut.set_exception(RuntimeError("SQLite writer is not running"))
+            return fut
+        self._queue.put((fn, fut))
+        return fut
+
+    def _run(self):
+        conn = self.engine.connect().execution_options(sqlite_begin="BEGIN IMMEDIATE")
+        try:
+            self._loop(conn)
+        finally:
+            conn.close()
+
+    def _loop(self, conn):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.wait
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                self._commit(conn, batch)
+            except Exception as e:
+                # Never let one bad batch end the writer thread
+                log.exception("SQLite writer batch error")
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+
+    def _commit(self, conn, batch):
+        outcomes = []
+        db = Session(bind=conn, autoflush=False, expire_on_commit=False)
+        try:
+            for fn, fut in batch:
+                if not fut.set_running_or_notify_cancel():
+                    continue
+                savepoint = db.begin_nested()
+                try:
+                    result = fn(db)
+                    savepoint.commit()
+                except Exception as e:
+                    savepoint.rollback()
+                    outcomes.append((fut, None, e))
+                    continue
+                outcomes.append((fut, result, None))
+            db.commit()
+        except Exception as e:
+            log.error("SQLite writer commit error: %s", e)
+            try:
+                db.rollback()
+                # After a failed COMMIT the driver connection can still be
+                # inside the transaction even though SQLAlchemy considers it
+                # over; without this the next batch would commit this
+                # batch's writes along with its own
+                conn.connection.rollback()
+            except Exception:
+                log.exception("SQLite writer rollback error")
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        finally:
+            db.close()
+        self.batches += 1
+        self.writes += len(outcomes)
+        for fut, result, error in outcomes:
+            if error is not None:
+                fut.set_exception(error)
+            else:
+                fut.set_result(result)
@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Tests that import app.main get a throwaway database and no KB index build
+_tmp = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp}/test.db")
+os.environ.setdefault("DISABLE_KB_INDEX", "true")
+os.environ.setdefault("KB_SNAPSHOT_DIR", f"{_tmp}/kb_index")
+os.environ.setdefault("NOTIFY_ASYNC", "true")
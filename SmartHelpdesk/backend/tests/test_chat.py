@@ -0,0 +1,56 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.models import SessionLocal, Ticket
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(main.app) as c:
+        yield c
+
+def wait_for(client, ref):
+    for _ in range(50):
+        status = client.get(f"/chat/tickets/{ref}").json()
+        if status["status"] != "pending":
+            return status
+        time.sleep(0.05)
+    raise AssertionError(f"{ref} still pending")
+
+def ticket_count():
+    db = SessionLocal()
+    try:
+        return db.query(Ticket).count()
+    finally:
+        db.close()
+
+def test_new_request_after_session_expiry_gets_a_new_ticket(client):
+    before = ticket_count()
+    first = client.post("/chat", json={"session_id": "s1", "message": "create ticket"}).json()
+    assert wait_for(client, first["ticket_ref"])["status"] == "created"
+    main.chat_sessions = type(main.chat_sessions)()  # expiry / restart resets the session
+    second = client.post("/chat", json={"session_id": "s1", "message": "create ticket"}).json()
+    assert second["ticket_ref"] != first["ticket_ref"]
+    assert wait_for(client, second["ticket_ref"])["status"] == "created"
+    assert ticket_count() == before + 2
+
+def test_resend_with_message_id_returns_same_ticket(client):
+    before = ticket_count()
+    body = {"session_id": "s2", "message": "create ticket", "message_id": "m-1"}
+    first = client.post("/chat", json=body).json()
+    again = client.post("/chat", json=body).json()
+    assert again["ticket_ref"] == first["ticket_ref"]
+    wait_for(client, first["ticket_ref"])
+    assert ticket_count() == before + 1
+
+def test_failed_ticket_is_reported(client, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("db down")
+
+    monkeypatch.setattr(main, "ingest_ticket", fail)
+    reply = client.post("/chat", json={"message": "create ticket", "message_id": "m-2"}).json()
+    status = wait_for(client, reply["ticket_ref"])
+    assert status["status"] == "failed"
+    assert "db down" in status["error"]
@@ -0,0 +1,48 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+
+from app import main
+from app.models import SessionLocal, Ticket
+from app.routing_prior import RoutingPrior
+from app.ticket_stats import TicketStats
+
+STATUSES = ["open", "in_progress", "resolved", "closed"]
+TEAMS = ["ServiceDesk", "Network", "Apps"]
+PRIORITIES = ["P1", "P2", "P3"]
+
+def test_concurrent_patches_keep_counters_exact():
+    with TestClient(main.app) as client:
+        db = SessionLocal()
+        try:
+            tickets = [Ticket(created_at=datetime.utcnow(), source="web", subject=f"t{i}", body="b", category="network",
+                              priority="P3", status="open", assignee_team="ServiceDesk") for i in range(50)]
+            db.add_all(tickets)
+            db.commit()
+            ids = [t.id for t in tickets]
+            main.ticket_stats.build(db)
+            main.routing_prior.build(db)
+        finally:
+            db.close()
+
+        rng = random.Random(7)
+        patches = [(rng.choice(ids), {"status": rng.choice(STATUSES), "assignee_team": rng.choice(TEAMS),
+                                      "priority": rng.choice(PRIORITIES)}) for _ in range(200)]
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            for r in pool.map(lambda p: client.patch(f"/tickets/{p[0]}", json=p[1]), patches):
+                assert r.status_code == 200
+
+        db = SessionLocal()
+        try:
+            fresh_stats, fresh_prior = TicketStats(), RoutingPrior()
+            fresh_stats.build(db)
+            fresh_prior.build(db)
+        finally:
+            db.close()
+        stats = client.get("/stats").json()
+        expected = fresh_stats.snapshot()
+        for field in ("total", "by_status", "by_category", "by_team", "by_priority", "open_by_team"):
+            assert stats[field] == expected[field], field
+        assert main.routing_prior._counts == fresh_prior._counts
@@ -0,0 +1,19 @@
+import os
+import subprocess
+import sys
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The lazy-import check is exact, but wall-clock time depends on the machine
+# and its load, so the suite only catches gross regressions unless
+# IMPORT_BUDGET_MS is set explicitly
+TEST_IMPORT_BUDGET_MS = os.getenv("IMPORT_BUDGET_MS", "10000")
+
+def test_app_import_stays_within_budget_and_lazy():
+    # Fails when app.main imports sklearn, numpy, requests, twilio, ... at
+    # startup instead of on first use, or goes over the budget above
+    proc = subprocess.run(
+        [sys.executable, os.path.join(BACKEND, "tools", "check_import_time.py")],
+        cwd=BACKEND, capture_output=True, text=True, timeout=120,
+        env=dict(os.environ, IMPORT_BUDGET_MS=TEST_IMPORT_BUDGET_MS),
+    )
+    assert proc.returncode == 0, proc.stdout + proc.stderr
@@ -0,0 +1,20 @@
+from sqlalchemy import inspect
+
+from app.models import engine, init_db
+
+def test_init_db_adds_missing_ticket_columns_and_indexes():
+    init_db()
+    # An install from before idempotency keys: no column, no index
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DROP INDEX IF EXISTS ux_tickets_idempotency_key")
+        conn.exec_driver_sql("ALTER TABLE tickets DROP COLUMN idempotency_key")
+    # Upgrading means a restart; pooled SQLite connections would otherwise
+    # parse the next ALTER against the schema they cached before the DROP
+    engine.dispose()
+    assert "idempotency_key" not in {c["name"] for c in inspect(engine).get_columns("tickets")}
+
+    init_db()
+    inspector = inspect(engine)
+    assert "idempotency_key" in {c["name"] for c in inspector.get_columns("tickets")}
+    unique = {i["name"]: i["unique"] for i in inspector.get_indexes("tickets")}
+    assert unique.get("ux_tickets_idempotency_key")
@@ -0,0 +1,88 @@
+import time
+from datetime import datetime
+
+import pytest
+
+from app import notifications, outbox
+from app.models import SessionLocal, Ticket, NotificationOutbox, init_db
+
+class FakeResponse:
+    def __init__(self, ok):
+        self.ok = ok
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise RuntimeError("webhook 500")
+
+class FakeSession:
+    def __init__(self, ok):
+        self.ok = ok
+        self.posts = []
+
+    def post(self, url, json=None, timeout=None):
+        self.posts.append(json)
+        return FakeResponse(self.ok)
+
+@pytest.fixture
+def worker(monkeypatch):
+    init_db()
+    coalescer = notifications.Coalescer(window=0.05, max_latency=0.2)
+    monkeypatch.setattr(notifications, "coalescer", coalescer)
+    monkeypatch.setattr(outbox, "coalescer", coalescer)
+    monkeypatch.setattr(notifications, "DISCORD_WEBHOOK_URL", "http://discord.invalid/hook")
+    w = outbox.OutboxWorker(workers=1)
+    coalescer.on_hold = w._hold
+    coalescer.on_release = w._release
+    return w
+
+def queue_alert():
+    db = SessionLocal()
+    try:
+        ticket = Ticket(created_at=datetime.utcnow(), source="web", subject="printer", body="jammed",
+                        category="printer", priority="P3", status="open", assignee_team="ServiceDesk")
+        db.add(ticket)
+        db.flush()
+        row = NotificationOutbox(event="ticket_created", ticket_id=ticket.id, attempts=1)
+        db.add(row)
+        db.commit()
+        return row.id
+    finally:
+        db.close()
+
+def load(oid):
+    db = SessionLocal()
+    try:
+        return db.get(NotificationOutbox, oid)
+    finally:
+        db.close()
+
+def settle(w, oid):
+    for _ in range(100):
+        if oid not in w._held:
+            return load(oid)
+        time.sleep(0.02)
+    raise AssertionError("digest never flushed")
+
+def test_row_is_sent_only_after_its_digest_flushes(worker, monkeypatch):
+    session = FakeSession(ok=True)
+    monkeypatch.setattr(notifications, "_http_session", lambda: session)
+    oid = queue_alert()
+    worker._process(oid)
+
+    held = load(oid)
+    assert held.status == "pending"
+    assert held.next_attempt_at > datetime.utcnow()  # leased: redelivered if we die now
+    assert not session.posts
+
+    row = settle(worker, oid)
+    assert row.status == "sent"
+    assert len(session.posts) == 1
+
+def test_failed_digest_leaves_row_for_retry(worker, monkeypatch):
+    monkeypatch.setattr(notifications, "_http_session", lambda: FakeSession(ok=False))
+    oid = queue_alert()
+    worker._process(oid)
+
+    row = settle(worker, oid)
+    assert row.status == "pending"
+    assert "webhook 500" in row.last_error
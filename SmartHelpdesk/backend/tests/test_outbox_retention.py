@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+
+from app import main, outbox
+from app.models import SessionLocal, NotificationOutbox, init_db
+
+def add_row(status, age_days):
+    db = SessionLocal()
+    try:
+        row = NotificationOutbox(event="ticket_created", ticket_id=1, status=status,
+                                 created_at=datetime.utcnow() - timedelta(days=age_days))
+        db.add(row)
+        db.commit()
+        return row.id
+    finally:
+        db.close()
+
+def remaining(ids):
+    db = SessionLocal()
+    try:
+        return {oid for (oid,) in db.query(NotificationOutbox.id).filter(NotificationOutbox.id.in_(ids))}
+    finally:
+        db.close()
+
+def test_prune_drops_only_expired_sent_and_failed_rows(monkeypatch):
+    init_db()
+    monkeypatch.setattr(outbox, "PRUNE_BATCH", 2)  # exercise the batching loop
+    old_sent = [add_row("sent", outbox.NOTIFY_RETENTION_DAYS + 1) for _ in range(3)]
+    new_sent = add_row("sent", 0)
+    old_failed = add_row("failed", outbox.NOTIFY_FAILED_RETENTION_DAYS + 1)
+    recent_failed = add_row("failed", outbox.NOTIFY_RETENTION_DAYS + 1)
+    old_pending = add_row("pending", outbox.NOTIFY_FAILED_RETENTION_DAYS + 1)
+
+    assert outbox.OutboxWorker().prune() == 4
+    assert remaining([*old_sent, new_sent, old_failed, recent_failed, old_pending]) == {new_sent, recent_failed, old_pending}
+
+def test_warm_up_starts_worker_even_if_startup_fails(monkeypatch):
+    started = []
+
+    def broken_init_db():
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(main, "init_db", broken_init_db)
+    monkeypatch.setattr(main.outbox, "NOTIFY_ASYNC", True)
+    monkeypatch.setattr(main.outbox.worker, "start", lambda: started.append(True))
+    main.warm_up()
+    assert started == [True]
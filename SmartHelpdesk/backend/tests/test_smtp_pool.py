@@ -0,0 +1,58 @@
+import smtplib
+
+import pytest
+
+from app.notifications import SMTPPool
+
+class FakeServer:
+    def __init__(self, outcomes):
+        self.outcomes = outcomes
+        self.sent = 0
+        self.closed = False
+
+    def send_message(self, msg):
+        self.sent += 1
+        outcome = self.outcomes.pop(0) if self.outcomes else None
+        if outcome:
+            raise outcome
+
+    def noop(self):
+        return (250, b"OK")
+
+    def quit(self):
+        self.closed = True
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = SMTPPool(size=1)
+    pool.connections = []
+    pool.outcomes = []
+
+    def connect():
+        server = FakeServer(pool.outcomes)
+        pool.connections.append(server)
+        return server
+
+    monkeypatch.setattr(pool, "_connect", connect)
+    return pool
+
+def test_rejections_keep_the_connection_and_do_not_resend(pool):
+    refused = smtplib.SMTPRecipientsRefused({"x@example.com": (550, b"no such user")})
+    pool.outcomes += [smtplib.SMTPDataError(550, b"rejected"), refused, smtplib.SMTPDataError(552, b"too big")]
+    for _ in range(3):
+        with pytest.raises(smtplib.SMTPException):
+            pool.send("msg")
+    assert len(pool.connections) == 1
+    assert pool.connections[0].sent == 3
+    assert not pool.connections[0].closed
+    assert len(pool._idle) == 1
+
+@pytest.mark.parametrize("error", [smtplib.SMTPServerDisconnected("gone"), ConnectionResetError("reset")])
+def test_dropped_connection_is_replaced_and_retried_once(pool, error):
+    pool.send("warm up")
+    pool.outcomes.append(error)
+    pool.send("msg")
+    stale, fresh = pool.connections
+    assert stale.closed and stale.sent == 2
+    assert fresh.sent == 1 and not fresh.closed
+    assert [s for s, _ in pool._idle] == [fresh]
@@ -0,0 +1,69 @@
+import pytest
+from sqlalchemy import create_engine, event, text
+
+from app.write_queue import WriteQueue
+
+@pytest.fixture
+def writer(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'wq.db'}")
+
+    # As models.py sets up the SQLite production profile: SQLAlchemy emits
+    # BEGIN itself so the writer's SAVEPOINTs nest inside the batch
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def on_begin(conn):
+        conn.exec_driver_sql(conn.get_execution_options().get("sqlite_begin", "BEGIN"))
+
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)"))
+    wq = WriteQueue(engine, wait_ms=0)
+    wq.start()
+    yield engine, wq
+    wq.stop()
+    engine.dispose()
+
+def insert(name):
+    def fn(db):
+        return db.execute(text("INSERT INTO items (name) VALUES (:n)"), {"n": name}).lastrowid
+    return fn
+
+def test_failed_commit_fails_futures_and_writer_survives(writer):
+    engine, wq = writer
+    failures = []
+
+    def fail_once(conn):
+        if not failures:
+            failures.append(conn)
+            raise RuntimeError("commit refused")
+
+    # Fires on the batch's real COMMIT, not on the per-write savepoints
+    event.listen(engine, "commit", fail_once)
+    try:
+        fut = wq.submit(insert("lost"))
+        with pytest.raises(RuntimeError, match="commit refused"):
+            fut.result(timeout=5)
+    finally:
+        event.remove(engine, "commit", fail_once)
+
+    assert wq._thread.is_alive()
+    assert wq.submit(insert("kept")).result(timeout=5)
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT name FROM items")).scalars().all() == ["kept"]
+
+def test_failing_write_rolls_back_only_itself(writer):
+    engine, wq = writer
+
+    def boom(db):
+        db.execute(text("INSERT INTO items (name) VALUES ('boom')"))
+        raise ValueError("bad write")
+
+    ok = wq.submit(insert("a"))
+    bad = wq.submit(boom)
+    assert ok.result(timeout=5)
+    with pytest.raises(ValueError):
+        bad.result(timeout=5)
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT name FROM items")).scalars().all() == ["a"]
@@ -0,0 +1,53 @@
+import os
+import re
+import subprocess
+import sys
+
+# Fails (exit 1) when importing the app takes longer than IMPORT_BUDGET_MS or
+# pulls in a module that should only load on first use. Run from backend/:
+#   python tools/check_import_time.py
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "1000"))
+LAZY_MODULES = ("sklearn", "numpy", "scipy", "joblib", "requests", "twilio")
+MODULE = os.getenv("IMPORT_MODULE", "app.main")
+
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+def main():
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, FAST_STARTUP="true")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {MODULE}"],
+        cwd=backend, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        print(proc.stderr[-2000:])
+        return 1
+    total, top, lazy = None, [], set()
+    for line in proc.stderr.splitlines():
+        m = LINE.match(line)
+        if not m:
+            continue
+        cumulative, indent, name = int(m.group(2)), len(m.group(3)), m.group(4)
+        if name == MODULE:
+            total = cumulative / 1000
+        elif indent == 3:
+            top.append((cumulative / 1000, name))
+        if name.split(".")[0] in LAZY_MODULES:
+            lazy.add(name.split(".")[0])
+    if total is None:
+        print(f"{MODULE} not found in -X importtime output")
+        return 1
+    print(f"import {MODULE}: {total:.0f} ms (budget {IMPORT_BUDGET_MS:.0f} ms)")
+    for ms, name in sorted(top, reverse=True)[:8]:
+        print(f"  {ms:8.1f} ms  {name}")
+    ok = True
+    if lazy:
+        print("Imported at startup but should load lazily:", ", ".join(sorted(lazy)))
+        ok = False
+    if total > IMPORT_BUDGET_MS:
+        print("Import time over budget")
+        ok = False
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
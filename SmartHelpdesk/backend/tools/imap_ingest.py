@@ -1,7 +1,15 @@
 import os
+import re
+import json
+import html
 import time
 import imaplib
 import email
+import email.message
+import threading
+from email.feedparser import BytesFeedParser
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import requests
 from dotenv import load_dotenv
 
@@ -16,6 +24,34 @@ POLL_SECONDS = int(os.getenv("IMAP_POLL_SECONDS", "30"))
 
 API_BASE = f"http://{os.getenv('HOST','0.0.0.0')}:{os.getenv('PORT','8000')}"
 INGEST_URL = f"{API_BASE}/tickets/ingest"
+BULK_URL = f"{API_BASE}/tickets/ingest/bulk"
+
+# UIDs per FETCH command, messages per POST, POSTs in flight and parser
+# processes. IMAP_BULK=false posts one message per request instead, which
+# also sends the Message-ID as Idempotency-Key.
+FETCH_BATCH = int(os.getenv("IMAP_FETCH_BATCH", "100"))
+POST_BATCH = int(os.getenv("IMAP_POST_BATCH", "50"))
+POST_CONCURRENCY = int(os.getenv("IMAP_POST_CONCURRENCY", "4"))
+PARSE_WORKERS = int(os.getenv("IMAP_PARSE_WORKERS", str(os.cpu_count() or 2)))
+USE_BULK = os.getenv("IMAP_BULK", "true").lower() == "true"
+# Highest UID handled per mailbox/UIDVALIDITY, so polls only look at new mail
+STATE_FILE = os.getenv("IMAP_STATE_FILE", "./imap_state.json")
+
+# Bytes fetched per message (0 = whole message); the first text part is
+# nearly always near the top, so large attachments are never downloaded
+FETCH_MAX_BYTES = int(os.getenv("IMAP_FETCH_MAX_BYTES", "262144"))
+# Ticket body size after quoted replies and signatures are stripped
+BODY_MAX_CHARS = int(os.getenv("IMAP_BODY_MAX_CHARS", "4000"))
+STRIP_QUOTES = os.getenv("IMAP_STRIP_QUOTES", "true").lower() == "true"
+PARSE_CHUNK = 64 * 1024
+
+FETCH_UID = re.compile(rb"UID (\d+)")
+# Where a reply's quoted history or a signature starts
+REPLY_MARKERS = re.compile(
+    r"^(On .+ wrote:\s*$|-{2,}\s*Original Message\s*-{2,}|_{10,}\s*$|From: .+$|-- $|Sent from my )",
+    re.IGNORECASE | re.MULTILINE,
+)
+TAGS = re.compile(r"<(script|style)\b.*?</\1\s*>|<[^>]+>", re.IGNORECASE | re.DOTALL)
 
 def connect():
     M = imaplib.IMAP4_SSL(IMAP_HOST, IMAP_PORT)
@@ -23,8 +59,44 @@ def connect():
     M.select(IMAP_MAILBOX)
     return M
 
+def is_body_part(part):
+    if part.get_content_maintype() != "text" or part.get_content_subtype() not in ("plain", "html"):
+        return False
+    return "attachment" not in str(part.get("Content-Disposition") or "").lower()
+
+def clean_body(text):
+    if STRIP_QUOTES:
+        m = REPLY_MARKERS.search(text)
+        if m and text[:m.start()].strip():
+            text = text[:m.start()]
+        text = "\n".join(line for line in text.splitlines() if not line.startswith(">"))
+    text = text.strip()
+    if BODY_MAX_CHARS and len(text) > BODY_MAX_CHARS:
+        text = text[:BODY_MAX_CHARS].rstrip() + "\n[truncated]"
+    return text
+
 def parse_message(raw_bytes):
-    msg = email.message_from_bytes(raw_bytes)
+    # Feeds the message to the parser in chunks and stops at the first
+    # text/plain or text/html part; other parts (attachments) are dropped as
+    # soon as the parser finishes them, without being decoded
+    found = []
+
+    class Part(email.message.Message):
+        def set_payload(self, payload, charset=None):
+            if isinstance(payload, str):
+                if is_body_part(self):
+                    found.append(self)
+                else:
+                    payload = ""
+            super().set_payload(payload, charset)
+
+    parser = BytesFeedParser(_factory=Part)
+    for i in range(0, len(raw_bytes), PARSE_CHUNK):
+        parser.feed(raw_bytes[i:i + PARSE_CHUNK])
+        if found:
+            break
+    msg = parser.close()
+
     subject_hdr = msg.get("Subject", "")
     decoded = email.header.decode_header(subject_hdr)
     subject = ""
@@ -34,32 +106,52 @@ def parse_message(raw_bytes):
         else:
             subject += part or ""
     from_addr = email.utils.parseaddr(msg.get("From", ""))[1]
+    message_id = (msg.get("Message-ID") or "").strip() or None
 
     body = ""
-    if msg.is_multipart():
-        for part in msg.walk():
-            ctype = part.get_content_type()
-            disp = str(part.get("Content-Disposition"))
-            if ctype == "text/plain" and "attachment" not in (disp or "").lower():
-                payload = part.get_payload(decode=True) or b""
-                body = payload.decode(errors="ignore")
-                break
-    else:
-        payload = msg.get_payload(decode=True) or b""
-        body = payload.decode(errors="ignore")
-
-    return subject or "(no subject)", body.strip(), from_addr
-
-def ingest_email(subject, body, sender, uid):
+    if found:
+        part = found[0]
+        payload = part.get_payload(decode=True) or b""
+        try:
+            body = payload.decode(part.get_content_charset() or "utf-8", errors="ignore")
+        except LookupError:
+            body = payload.decode(errors="ignore")
+        if part.get_content_subtype() == "html":
+            body = html.unescape(TAGS.sub(" ", body))
+            body = re.sub(r"[ \t]+", " ", re.sub(r"\s*\n\s*", "\n", body))
+
+    return subject or "(no subject)", clean_body(body), from_addr, message_id
+
+def try_parse(raw_bytes):
+    # Runs in the parser pool; a malformed message is logged and left unread
+    try:
+        return parse_message(raw_bytes)
+    except Exception as e:
+        print(f"[IMAP] Could not parse message: {e}")
+        return None
+
+_local = threading.local()
+
+def session():
+    # One keep-alive session per posting thread
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+def ingest_email(subject, body, sender, source_ref, message_id=None):
     data = {
         "subject": subject,
         "body": body,
         "user_email": sender,
         "channel": "email",
-        "source_ref": f"imap:{uid}"
+        "source_ref": source_ref
     }
+    # Retries after a timeout (message not yet marked \Seen) come back as the
+    # ticket already created instead of a duplicate
+    headers = {"Idempotency-Key": f"email:{message_id}"[:200]} if message_id else {}
+    uid = source_ref.rsplit(":", 1)[-1]
     try:
-        r = requests.post(INGEST_URL, json=data, timeout=10)
+        r = session().post(INGEST_URL, json=data, headers=headers, timeout=10)
         r.raise_for_status()
         print(f"[IMAP] Ingested UID {uid}: {subject}")
         return True
@@ -67,30 +159,162 @@ def ingest_email(subject, body, sender, uid):
         print(f"[IMAP] Failed to ingest UID {uid}: {e}")
         return False
 
+def ingest_batch(items):
+    # items: [(uid, (subject, body, sender, message_id), source_ref)]
+    # Returns the UIDs that now have a ticket (new or duplicate)
+    if not USE_BULK:
+        return [uid for uid, (subject, body, sender, message_id), ref in items
+                if ingest_email(subject, body, sender, ref, message_id)]
+    records = [{
+        "subject": subject,
+        "body": body,
+        "user_email": sender,
+        "channel": "email",
+        "source_ref": ref,
+    } for uid, (subject, body, sender, message_id), ref in items]
+    try:
+        r = session().post(BULK_URL, json=records, timeout=120)
+        r.raise_for_status()
+        results = r.json()["results"]
+    except Exception as e:
+        print(f"[IMAP] Failed to ingest UIDs {items[0][0]}..{items[-1][0]}: {e}")
+        return []
+    done = []
+    for (uid, parsed, ref), res in zip(items, results):
+        if res.get("ok"):
+            done.append(uid)
+            print(f"[IMAP] Ingested UID {uid}: {parsed[0]}" + (" (duplicate)" if res.get("duplicate") else ""))
+        else:
+            print(f"[IMAP] Failed to ingest UID {uid}: {res.get('error')}")
+    return done
+
+def load_state():
+    try:
+        with open(STATE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_state(state):
+    tmp = STATE_FILE + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, STATE_FILE)
+
+def fetch_batch(M, uids):
+    # One UID FETCH for the whole batch; BODY.PEEK leaves \Seen alone so a
+    # message is only marked once its ticket exists
+    section = f"BODY.PEEK[]<0.{FETCH_MAX_BYTES}>" if FETCH_MAX_BYTES else "BODY.PEEK[]"
+    typ, data = M.uid("fetch", b",".join(uids), f"(UID {section})")
+    if typ != "OK":
+        raise RuntimeError("IMAP fetch failed")
+    out = []
+    for item in data:
+        if isinstance(item, tuple):
+            m = FETCH_UID.search(item[0])
+            if m:
+                out.append((m.group(1).decode(), item[1]))
+    return out
+
+class Ingester:
+    # Keeps one IMAP connection for the life of the process. Each poll
+    # searches only UIDs above the last one handled, fetches them in batches,
+    # parses in a process pool and posts with bounded concurrency while the
+    # next batch is being fetched.
+    def __init__(self):
+        self.M = None
+        self.validity = None
+        self.state = load_state()
+        self.parsers = ProcessPoolExecutor(max_workers=max(1, PARSE_WORKERS))
+        self.posters = ThreadPoolExecutor(max_workers=max(1, POST_CONCURRENCY))
+        self.inflight = deque()
+        self.failed = set()
+
+    def ensure_connected(self):
+        if self.M is not None:
+            try:
+                # NOOP is the keep-alive and lets the server report new mail
+                if self.M.noop()[0] == "OK":
+                    return
+            except Exception:
+                pass
+            self.close()
+        self.M = connect()
+        self.validity = (self.M.response("UIDVALIDITY")[1] or [b"0"])[0].decode()
+
+    def close(self):
+        if self.M is not None:
+            try:
+                self.M.logout()
+            except Exception:
+                pass
+            self.M = None
+
+    def poll(self):
+        # Returns how many new UIDs were seen; self.failed holds the ones to retry
+        self.ensure_connected()
+        key = f"{IMAP_MAILBOX}:{self.validity}"
+        last = int(self.state.get(key, 0))
+        typ, data = self.M.uid("search", None, f"UID {last + 1}:*", "UNSEEN")
+        if typ != "OK":
+            raise RuntimeError("IMAP search failed")
+        # "n:*" always matches the newest message, even when its UID < n
+        uids = sorted((u for u in data[0].split() if int(u) > last), key=int)
+        self.failed.clear()
+        if not uids:
+            return 0
+        for i in range(0, len(uids), FETCH_BATCH):
+            wanted = uids[i:i + FETCH_BATCH]
+            fetched = fetch_batch(self.M, wanted)
+            self.failed.update({u.decode() for u in wanted} - {uid for uid, _ in fetched})
+            parsed = self.parsers.map(try_parse, [raw for _, raw in fetched], chunksize=8)
+            items = [
+                (uid, p, f"imap:{IMAP_MAILBOX}:{self.validity}:{uid}")
+                for (uid, _), p in zip(fetched, parsed) if p is not None
+            ]
+            for j in range(0, len(items), POST_BATCH):
+                chunk = items[j:j + POST_BATCH]
+                self.inflight.append(([uid for uid, _, _ in chunk], self.posters.submit(ingest_batch, chunk)))
+                while len(self.inflight) > POST_CONCURRENCY:
+                    self.complete_one()
+        while self.inflight:
+            self.complete_one()
+        # Advance past everything handled, stopping short of the first
+        # failure so it is retried on the next poll
+        done_up_to = int(uids[-1])
+        if self.failed:
+            done_up_to = min(int(u) for u in self.failed) - 1
+        if done_up_to > last:
+            self.state[key] = done_up_to
+            save_state(self.state)
+        return len(uids)
+
+    def complete_one(self):
+        sent, fut = self.inflight.popleft()
+        try:
+            done = fut.result()
+        except Exception as e:
+            print(f"[IMAP] Ingest error: {e}")
+            done = []
+        if done:
+            self.M.uid("store", ",".join(done), "+FLAGS", "\\Seen")
+        self.failed.update(set(sent) - set(done))
+
 def main():
     if not all([IMAP_HOST, IMAP_USER, IMAP_PASS]):
         print("[IMAP] Missing IMAP configuration in .env; exiting.")
         return
+    ingester = Ingester()
     while True:
         try:
-            M = connect()
-            typ, data = M.search(None, 'UNSEEN')
-            if typ != "OK":
-                raise RuntimeError("IMAP search failed")
-            uids = data[0].split()
-            for uid in uids:
-                typ, msg_data = M.fetch(uid, '(RFC822)')
-                if typ != "OK":
-                    continue
-                raw = msg_data[0][1]
-                subject, body, sender = parse_message(raw)
-                ok = ingest_email(subject, body, sender, uid.decode())
-                if ok:
-                    M.store(uid, '+FLAGS', '\\Seen')
-            M.logout()
+            # Drain a backlog batch after batch; sleep once caught up or
+            # when something needs a retry
+            while ingester.poll() and not ingester.failed:
+                pass
         except Exception as e:
             print(f"[IMAP] Error: {e}")
+            ingester.close()
         time.sleep(POLL_SECONDS)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
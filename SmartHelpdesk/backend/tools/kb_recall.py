@@ -0,0 +1,50 @@
+import os
+import sys
+import time
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv()
+
+from app.models import SessionLocal, Ticket  # noqa: E402
+from app.knowledge_base import KBEngine  # noqa: E402
+from app.ann_index import SemanticKBEngine, recall_at_k  # noqa: E402
+
+SAMPLE = int(os.getenv("KB_RECALL_SAMPLE", "500"))
+TOP_K = int(os.getenv("KB_RECALL_TOP_K", "10"))
+NPROBES = [int(p) for p in os.getenv("KB_RECALL_NPROBES", "1,2,4,8,16,32").split(",")]
+
+def run(engine, db, texts):
+    start = time.perf_counter()
+    results = engine.suggest_many(db, texts, top_k=TOP_K)
+    return results, (time.perf_counter() - start) * 1000 / len(texts)
+
+def main():
+    db = SessionLocal()
+    try:
+        rows = db.query(Ticket.subject, Ticket.body).order_by(Ticket.id.desc()).limit(SAMPLE).all()
+        texts = [f"{r.subject} {r.body}" for r in rows]
+        if not texts:
+            print("[KB] No tickets to use as queries; exiting.")
+            return
+        exact = KBEngine()
+        exact.build_index(db)
+        # min_docs=0 forces the ANN path even on a small KB; nprobe=0 scans every list
+        ann = SemanticKBEngine(nprobe=0, min_docs=0)
+        ann.build_index(db)
+
+        exact_results, ms = run(exact, db, texts)
+        print(f"[KB] {len(texts)} queries, top {TOP_K}; exact tf-idf {ms:.3f} ms/query")
+        full_results, ms = run(ann, db, texts)
+        print(f"[KB] lsa exhaustive: {ms:.3f} ms/query, recall vs exact {recall_at_k(exact_results, full_results):.3f}")
+        for nprobe in NPROBES:
+            ann.nprobe = nprobe
+            results, ms = run(ann, db, texts)
+            print(f"[KB] lsa nprobe={nprobe}: {ms:.3f} ms/query, "
+                  f"recall vs exhaustive {recall_at_k(full_results, results):.3f}, "
+                  f"vs exact {recall_at_k(exact_results, results):.3f}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import os
+import sys
+from collections import Counter
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv()
+
+from sklearn.model_selection import train_test_split  # noqa: E402
+from app.models import SessionLocal, Ticket  # noqa: E402
+from app.classifier import CLASSIFIER_MODEL_PATH  # noqa: E402
+from app.ml_classifier import MLClassifier  # noqa: E402
+
+MIN_PER_CLASS = int(os.getenv("CLASSIFIER_MIN_PER_CLASS", "5"))
+
+def main():
+    if not CLASSIFIER_MODEL_PATH:
+        print("[TRAIN] CLASSIFIER_MODEL_PATH is empty; exiting.")
+        return
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(Ticket.subject, Ticket.body, Ticket.category)
+            .filter(Ticket.category != None)
+            .yield_per(5000)
+        )
+        texts, labels = [], []
+        for r in rows:
+            texts.append(f"{r.subject}\n{r.body}")
+            labels.append(r.category)
+    finally:
+        db.close()
+
+    counts = Counter(labels)
+    keep = {c for c, n in counts.items() if n >= MIN_PER_CLASS}
+    data = [(t, l) for t, l in zip(texts, labels) if l in keep]
+    if len(keep) < 2:
+        print(f"[TRAIN] Need at least 2 categories with {MIN_PER_CLASS}+ tickets; have {dict(counts)}")
+        return
+    texts, labels = [t for t, _ in data], [l for _, l in data]
+    print(f"[TRAIN] {len(texts)} tickets, {len(keep)} categories: {dict(Counter(labels))}")
+
+    train_x, test_x, train_y, test_y = train_test_split(texts, labels, test_size=0.2, random_state=0, stratify=labels)
+    held_out = MLClassifier.train(train_x, train_y)
+    accuracy = sum(p == y for (p, _), y in zip(held_out.predict(test_x), test_y)) / len(test_y)
+    print(f"[TRAIN] Held-out accuracy: {accuracy:.3f}")
+
+    model = MLClassifier.train(texts, labels)
+    model.save(CLASSIFIER_MODEL_PATH)
+    print(f"[TRAIN] Saved model {model.version} to {CLASSIFIER_MODEL_PATH}")
+
+if __name__ == "__main__":
+    main()
@@ -17,7 +17,25 @@ export async function listTickets(limit = 50) {
   return data
 }
 
-export async function chatMessage(message, user_email, user_phone) {
-  const { data } = await api.post('/chat', { message, user_email, user_phone })
+export async function chatMessage(message, user_email, user_phone, session_id, message_id) {
+  const { data } = await api.post('/chat', { message, user_email, user_phone, session_id, message_id })
   return data
-}
\ No newline at end of file
+}
+
+export async function getChatTicket(ref) {
+  const { data } = await api.get(`/chat/tickets/${encodeURIComponent(ref)}`)
+  return data
+}
+
+export async function getStats() {
+  const { data } = await api.get('/stats')
+  return data
+}
+
+export function streamTickets(onEvent) {
+  const source = new EventSource(`${apiBase}/tickets/stream`)
+  for (const type of ['ticket_created', 'ticket_updated', 'ticket_assigned', 'reset']) {
+    source.addEventListener(type, (e) => onEvent(type, JSON.parse(e.data)))
+  }
+  return () => source.close()
+}
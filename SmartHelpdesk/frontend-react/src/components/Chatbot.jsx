@@ -1,5 +1,5 @@
 import React, { useState, useEffect, useRef } from "react";
-import { chatMessage } from "../api/apiClient";
+import { chatMessage, getChatTicket } from "../api/apiClient";
 import { useAuth } from "../context/AuthContext";
 
 export default function Chatbot({ onTicketCreated }) {
@@ -14,6 +14,7 @@ export default function Chatbot({ onTicketCreated }) {
   const [sending, setSending] = useState(false);
   const [email, setEmail] = useState("");
   const [phone, setPhone] = useState("");
+  const sessionId = useRef(null);
   const chatEndRef = useRef();
 
   // Autofill email from logged-in user
@@ -26,6 +27,23 @@ export default function Chatbot({ onTicketCreated }) {
     chatEndRef.current?.scrollIntoView({ behavior: "smooth" });
   }, [log]);
 
+  // The ticket is created in the background; report how it went
+  async function followTicket(ref, attempt = 0) {
+    try {
+      const t = await getChatTicket(ref);
+      if (t.status === "pending" && attempt < 10) {
+        setTimeout(() => followTicket(ref, attempt + 1), 1000);
+      } else if (t.status === "created") {
+        setLog((l) => [...l, { role: "bot", text: `✅ Ticket #${t.ticket_id} created.` }]);
+        onTicketCreated?.();
+      } else if (t.status === "failed") {
+        setLog((l) => [...l, { role: "bot", text: "❌ Sorry, the ticket could not be created. Please try again." }]);
+      }
+    } catch (err) {
+      console.error(err);
+    }
+  }
+
   async function send() {
     const text = input.trim();
     if (!text) return;
@@ -33,11 +51,12 @@ export default function Chatbot({ onTicketCreated }) {
     setInput("");
     setSending(true);
     try {
-      const data = await chatMessage(text, email || null, phone || null);
+      const messageId = crypto.randomUUID();
+      const data = await chatMessage(text, email || null, phone || null, sessionId.current, messageId);
+      sessionId.current = data.session_id || sessionId.current;
       let reply = data.response;
-      if (data.ticket) {
-        reply += ` 🎉 Ticket #${data.ticket.id} created.`;
-        onTicketCreated?.();
+      if (data.ticket_ref) {
+        setTimeout(() => followTicket(data.ticket_ref), 500);
       }
       setLog((l) => [...l, { role: "bot", text: reply }]);
     } catch (err) {
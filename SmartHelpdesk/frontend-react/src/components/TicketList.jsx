@@ -1,5 +1,5 @@
 import React, { useEffect, useState } from "react";
-import { listTickets } from "../api/apiClient";
+import { listTickets, streamTickets } from "../api/apiClient";
 
 export default function TicketList({ refreshFlag }) {
   const [tickets, setTickets] = useState([]);
@@ -22,6 +22,22 @@ export default function TicketList({ refreshFlag }) {
     load();
   }, [refreshFlag]);
 
+  useEffect(() => {
+    return streamTickets((type, t) => {
+      if (type === "reset") {
+        load();
+        return;
+      }
+      setTickets((prev) => {
+        const rest = prev.filter((p) => p.id !== t.id);
+        if (type === "ticket_created" || rest.length === prev.length) {
+          return [t, ...rest].slice(0, 100);
+        }
+        return prev.map((p) => (p.id === t.id ? { ...p, ...t } : p));
+      });
+    });
+  }, []);
+
   return (
     <div className="flex flex-col gap-3">
       {tickets.map((t) => (
@@ -2,20 +2,27 @@ import { useState, useEffect } from "react";
 import Chatbot from "../components/Chatbot";
 import TicketForm from "../components/TicketForm";
 import TicketList from "../components/TicketList";
+import { getStats } from "../api/apiClient";
 
 export default function Dashboard() {
   const [refreshFlag, setRefreshFlag] = useState(0);
+  const [summary, setSummary] = useState(null);
 
   useEffect(() => {
     const timer = setInterval(() => {}, 1000); // optional, can remove if not showing time
     return () => clearInterval(timer);
   }, []);
 
+  useEffect(() => {
+    getStats().then(setSummary).catch((err) => console.error(err));
+  }, [refreshFlag]);
+
+  const sum = (obj) => Object.values(obj || {}).reduce((a, b) => a + b, 0);
   const stats = [
-    { label: 'My Tickets', value: '23' },
-    { label: 'Late Tickets', value: '4' },
-    { label: 'Incidents', value: '12' },
-    { label: 'Assets', value: '156' }
+    { label: 'Total Tickets', value: summary ? summary.total : '-' },
+    { label: 'Open Backlog', value: summary ? sum(summary.open_by_team) : '-' },
+    { label: 'Created (24h)', value: summary ? sum(summary.created_per_hour.slice(-24).map((h) => h.count)) : '-' },
+    { label: 'Teams', value: summary ? Object.keys(summary.by_team).length : '-' }
   ];
 
   return (